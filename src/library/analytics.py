@@ -0,0 +1,296 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from library.runner import THRESHOLD
+from library.simulator import BackTester
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60  # 暗号資産は土日も取引される
+
+
+def periods_per_year(timestamps: np.ndarray) -> float:
+    """
+    バーの間隔(中央値)から, 1年あたりのバーの本数を求める
+
+    Args:
+        timestamps (np.ndarray): datetime64またはUNIXtime[ns]
+    """
+    ns = np.asarray(timestamps).astype("datetime64[ns]").astype(np.int64)
+    return SECONDS_PER_YEAR * 10**9 / float(np.median(np.diff(ns)))
+
+
+def returns(valuation: np.ndarray) -> np.ndarray:
+    """
+    1本ごとのリターン. 最後の軸が時間で, 長さは1本短くなる.
+    """
+    valuation = np.asarray(valuation, dtype=np.float64)
+    return valuation[..., 1:] / valuation[..., :-1] - 1
+
+
+def drawdown(valuation: np.ndarray) -> np.ndarray:
+    """
+    直近の最高値からの下落率
+    """
+    valuation = np.asarray(valuation, dtype=np.float64)
+    peak = np.maximum.accumulate(valuation, axis=-1)
+    return (peak - valuation) / peak
+
+
+def max_drawdown_duration(valuation: np.ndarray) -> np.ndarray:
+    """
+    最高値を更新できなかった期間の最大の長さ(本数)
+    """
+    valuation = np.asarray(valuation, dtype=np.float64)
+    is_underwater = drawdown(valuation) > 0
+    index = np.broadcast_to(np.arange(valuation.shape[-1]), valuation.shape)
+    # 直近で最高値だったバーの番号
+    last_peak = np.maximum.accumulate(np.where(is_underwater, 0, index), axis=-1)
+    return np.max(index - last_peak, axis=-1)
+
+
+def compute_metrics(
+    timestamps: np.ndarray,
+    cash: np.ndarray,
+    valuation: np.ndarray,
+    threshold: float = THRESHOLD,
+) -> pd.DataFrame:
+    """
+    snapshotの配列から評価指標を計算する. cash, valuationは (バー数,) なら1回分,
+    (実行数, バー数) なら全ての実行をまとめて計算する(時刻は共通).
+
+    Args:
+        timestamps (np.ndarray): 各バーの時刻. datetime64またはUNIXtime[ns].
+        cash (np.ndarray): 各バーのcash.
+        valuation (np.ndarray): 各バーの評価額.
+        threshold (float): ポジションの評価額がこれ以上のバーをエクスポージャーに数える.
+
+    Returns:
+        pd.DataFrame: 1行が1回の実行.
+    """
+    cash = np.atleast_2d(np.asarray(cash, dtype=np.float64))
+    valuation = np.atleast_2d(np.asarray(valuation, dtype=np.float64))
+    ns = np.asarray(timestamps).astype("datetime64[ns]").astype(np.int64)
+    annual = periods_per_year(ns)
+    years = (ns[-1] - ns[0]) / 10**9 / SECONDS_PER_YEAR
+
+    r = returns(valuation)
+    mean = r.mean(axis=-1)
+    std = r.std(axis=-1, ddof=1)
+    downside = np.sqrt(np.mean(np.minimum(r, 0) ** 2, axis=-1))
+    total_return = valuation[:, -1] / valuation[:, 0] - 1
+    cagr = (1 + total_return) ** (1 / years) - 1 if years > 0 else np.nan
+    max_drawdown = drawdown(valuation).max(axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame(
+            {
+                "final_valuation": valuation[:, -1],
+                "total_return": total_return,
+                "cagr": cagr,
+                "volatility": std * np.sqrt(annual),
+                "sharpe": np.where(std > 0, mean / std * np.sqrt(annual), np.nan),
+                "sortino": np.where(
+                    downside > 0, mean / downside * np.sqrt(annual), np.nan
+                ),
+                "max_drawdown": max_drawdown,
+                "max_drawdown_duration": max_drawdown_duration(valuation),
+                "calmar": np.where(max_drawdown > 0, cagr / max_drawdown, np.nan),
+                "exposure": np.mean(np.abs(valuation - cash) >= threshold, axis=-1),
+            }
+        )
+
+
+def stack_snapshots(
+    snapshots: dict[str, pd.DataFrame] | list[pd.DataFrame],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[Any]]:
+    """
+    同じ時刻のsnapshotsを (実行数, バー数) の配列にまとめる.
+    Ex. PortfolioRunner.snapshots
+
+    Returns:
+        timestamps, cash, valuation, 実行の名前(listならindex)
+    """
+    names: list[Any]
+    if isinstance(snapshots, dict):
+        names, frames = list(snapshots.keys()), list(snapshots.values())
+    else:
+        names, frames = list(range(len(snapshots))), list(snapshots)
+    index = frames[0].index
+    if any(not frame.index.equals(index) for frame in frames[1:]):
+        raise ValueError("All snapshots must share the same index.")
+    cash = np.stack([frame["cash"].to_numpy(np.float64) for frame in frames])
+    valuation = np.stack([frame["valuation"].to_numpy(np.float64) for frame in frames])
+    return index.values, cash, valuation, names
+
+
+def metrics_from_snapshots(
+    snapshots: dict[str, pd.DataFrame] | list[pd.DataFrame],
+) -> pd.DataFrame:
+    timestamps, cash, valuation, names = stack_snapshots(snapshots)
+    metrics = compute_metrics(timestamps, cash, valuation)
+    metrics.index = pd.Index(names, name="run")
+    return metrics
+
+
+def rolling_metrics(
+    timestamps: np.ndarray, valuation: np.ndarray, window: int
+) -> dict[str, np.ndarray]:
+    """
+    window本の窓での指標. 配列の形はvaluationと同じで, 窓が揃わない先頭はNaN.
+    リターンの平均・標準偏差は累積和から, 窓の中の最高値はsliding_window_viewから求める.
+
+    Returns:
+        dict[str, np.ndarray]: "return", "volatility", "sharpe", "drawdown"
+    """
+    valuation = np.asarray(valuation, dtype=np.float64)
+    annual = periods_per_year(timestamps)
+    shape = valuation.shape
+    n = shape[-1]
+    result = {key: np.full(shape, np.nan) for key in ("return", "volatility", "sharpe")}
+    result["drawdown"] = np.full(shape, np.nan)
+    if window >= n:
+        return result
+
+    result["return"][..., window:] = (
+        valuation[..., window:] / valuation[..., :-window] - 1
+    )
+
+    # t本目の窓のリターンは r[t - window : t] (r[k]はk -> k + 1本目)
+    r = returns(valuation)
+    zero = np.zeros(shape[:-1] + (1,))
+    cumsum = np.concatenate([zero, np.cumsum(r, axis=-1)], axis=-1)
+    cumsum_sq = np.concatenate([zero, np.cumsum(r * r, axis=-1)], axis=-1)
+    window_sum = cumsum[..., window:] - cumsum[..., :-window]
+    window_sum_sq = cumsum_sq[..., window:] - cumsum_sq[..., :-window]
+    mean = window_sum / window
+    var = np.maximum(window_sum_sq - window_sum * mean, 0) / (window - 1)
+    std = np.sqrt(var)
+    result["volatility"][..., window:] = std * np.sqrt(annual)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["sharpe"][..., window:] = np.where(
+            std > 0, mean / std * np.sqrt(annual), np.nan
+        )
+
+    windows = np.lib.stride_tricks.sliding_window_view(valuation, window + 1, axis=-1)
+    peak = windows.max(axis=-1)
+    result["drawdown"][..., window:] = (peak - valuation[..., window:]) / peak
+    return result
+
+
+def round_trips(
+    completion_time: np.ndarray,
+    position_diff: np.ndarray,
+    cash_diff: np.ndarray,
+    threshold: float = THRESHOLD,
+) -> pd.DataFrame:
+    """
+    約定した注文の列を, ポジションを持ってから閉じるまでの1往復ずつにまとめる.
+    ポジションの評価額(約定価格基準)がthreshold未満になった約定で1往復が終わる(Runnerと同じ).
+
+    Args:
+        completion_time (np.ndarray): 約定時刻. 昇順.
+        position_diff (np.ndarray): 各約定のpositionの増減.
+        cash_diff (np.ndarray): 各約定のcashの増減.
+
+    Returns:
+        pd.DataFrame: 1行が1往復. 閉じていない最後の往復はis_closed=Falseでpnl等はNaN.
+    """
+    completion_time = np.asarray(completion_time).astype("datetime64[ns]")
+    position_diff = np.asarray(position_diff, dtype=np.float64)
+    cash_diff = np.asarray(cash_diff, dtype=np.float64)
+    # 数量0の約定は何も変えないので除く
+    is_trade = position_diff != 0
+    completion_time = completion_time[is_trade]
+    position_diff = position_diff[is_trade]
+    cash_diff = cash_diff[is_trade]
+    columns = [
+        "entry_time",
+        "exit_time",
+        "side",
+        "size",
+        "cost",
+        "pnl",
+        "return",
+        "holding_period",
+        "num_fills",
+        "is_closed",
+    ]
+    n = len(position_diff)
+    if n == 0:
+        return pd.DataFrame(columns=columns)
+
+    position = np.cumsum(position_diff)
+    price = np.abs(cash_diff / position_diff)
+    is_flat = np.abs(position) * price < threshold
+    # 各約定が何番目の往復に属するか
+    trip = np.concatenate([[0], np.cumsum(is_flat)[:-1]])
+    starts = np.flatnonzero(np.r_[True, trip[1:] != trip[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+
+    side = np.sign(position_diff[starts])
+    # 建てる方向の約定だけを数量・コストに数える
+    is_entry = np.sign(position_diff) == side[trip]
+    size = np.add.reduceat(np.where(is_entry, np.abs(position_diff), 0), starts)
+    cost = np.add.reduceat(np.where(is_entry, np.abs(cash_diff), 0), starts)
+    is_closed = is_flat[ends]
+    pnl = np.where(is_closed, np.add.reduceat(cash_diff, starts), np.nan)
+
+    return pd.DataFrame(
+        {
+            "entry_time": completion_time[starts],
+            "exit_time": np.where(
+                is_closed, completion_time[ends], np.datetime64("NaT")
+            ),
+            "side": np.where(side > 0, "BUY", "SELL"),
+            "size": size,
+            "cost": cost,
+            "pnl": pnl,
+            "return": pnl / cost,
+            "holding_period": np.where(
+                is_closed,
+                completion_time[ends] - completion_time[starts],
+                np.timedelta64("NaT"),
+            ),
+            "num_fills": ends - starts + 1,
+            "is_closed": is_closed,
+        },
+        columns=columns,
+    )
+
+
+def trade_summary(trades: pd.DataFrame) -> dict[str, float]:
+    """
+    round_tripsの閉じた往復の勝率やプロフィットファクターなど
+    """
+    pnl = trades.loc[trades["is_closed"], "pnl"].to_numpy(np.float64)
+    gain = pnl[pnl > 0].sum()
+    loss = -pnl[pnl < 0].sum()
+    return {
+        "num_trades": len(pnl),
+        "win_rate": float(np.mean(pnl > 0)) if len(pnl) else np.nan,
+        "avg_pnl": float(pnl.mean()) if len(pnl) else np.nan,
+        "profit_factor": float(gain / loss) if loss > 0 else np.nan,
+    }
+
+
+def analyze(tester: BackTester) -> tuple[pd.Series, pd.DataFrame]:
+    """
+    実行後のBackTesterから, 評価指標と往復の表を作る.
+
+    Returns:
+        (評価指標, 往復の表)
+    """
+    snapshots = tester.recorder.to_array()
+    metrics = compute_metrics(
+        snapshots["timestamp"], snapshots["cash"], snapshots["valuation"]
+    ).iloc[0]
+    # trade_logは約定した順に並んでいる
+    log = tester.order_registry.trade_log("executed")
+    trades = round_trips(
+        log["completion_time"].to_numpy(),
+        log["position_diff"].to_numpy(),
+        log["cash_diff"].to_numpy(),
+    )
+    metrics = pd.concat([metrics, pd.Series(trade_summary(trades))])
+    return metrics, trades
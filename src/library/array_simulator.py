@@ -0,0 +1,242 @@
+import math
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from library.runner import THRESHOLD
+from library.simulator import INITIAL_CASH, Side, SignalArrays
+
+NO_EXIT_TIME = -1  # exit_time = None に相当
+
+
+class OrderLog(NamedTuple):
+    timestamp: int  # 発注時刻 (unixtime)
+    side: Side
+    size: float
+    completion_time: int
+    completion_status: str
+    cash_diff: float | None = None
+    position_diff: float | None = None
+
+
+class ArrayBackTester:
+    """
+    BackTester + Runnerと同じ約定ルール(成行/指値/有効期限/スリッページ)を,
+    numpy配列と事前計算したシグナル配列の上で実行する.
+
+    ポジションの状態が変わりうるバー(シグナル, 手仕舞い, 注文処理)だけをループで処理し,
+    その間のバーはまとめて飛ばす. snapshotsは最後にベクトル演算で作る.
+    """
+
+    def __init__(self, ohlcv_df: pd.DataFrame, config: dict[str, Any]) -> None:
+        # UNIXtime(秒)に変換
+        times = ohlcv_df.index.values.astype("datetime64[s]").astype(np.int64)
+        self._init_arrays(
+            times=times,
+            open_=ohlcv_df["open"].to_numpy(),
+            high=ohlcv_df["high"].to_numpy(),
+            low=ohlcv_df["low"].to_numpy(),
+            close=ohlcv_df["close"].to_numpy(),
+            volume=ohlcv_df["volume"].to_numpy(),
+            config=config,
+        )
+        self.index = ohlcv_df.index
+
+    @classmethod
+    def from_arrays(
+        cls,
+        times: np.ndarray,
+        open_: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        volume: np.ndarray,
+        config: dict[str, Any],
+    ) -> "ArrayBackTester":
+        tester = cls.__new__(cls)
+        tester._init_arrays(times, open_, high, low, close, volume, config)
+        tester.index = pd.DatetimeIndex(
+            pd.to_datetime(tester.times, unit="s"), name="timestamp"
+        )
+        return tester
+
+    def _init_arrays(
+        self,
+        times: np.ndarray,
+        open_: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        volume: np.ndarray,
+        config: dict[str, Any],
+    ) -> None:
+        self.times = np.ascontiguousarray(times, dtype=np.int64)
+        self.open = np.ascontiguousarray(open_, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+        self.slippage: float = config["slippage"]  # 成行注文の時のスリッページ想定値
+        self.minutes_to_expire: int = config["minutes_to_expire"]
+
+        self.cash: float = config.get("initial_cash", INITIAL_CASH)
+        self.position: float = 0
+        self.orders: list[OrderLog] = []
+        # cash, positionが変化したバーのindexと変化後の値
+        self._change_idx: list[int] = [0]
+        self._change_cash: list[float] = [self.cash]
+        self._change_position: list[float] = [self.position]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def run(self, signals: SignalArrays) -> None:
+        n = len(self)
+        side = np.asarray(signals.side, dtype=np.int8)
+        if len(side) != n:
+            raise ValueError("length of signals must match ohlcv.")
+        size_fraction = np.asarray(signals.size_fraction, dtype=np.float64).tolist()
+        exit_offset = np.asarray(signals.exit_offset, dtype=np.int64).tolist()
+        if signals.limit_price is None:
+            limit_price = [float("nan")] * n
+        else:
+            limit_price = np.asarray(signals.limit_price, dtype=np.float64).tolist()
+        signal_idx = np.flatnonzero(side)
+        side_l = side.tolist()
+
+        # ループ内ではpythonのスカラーを使う
+        times = self.times.tolist()
+        high = self.high.tolist()
+        low = self.low.tolist()
+        close = self.close.tolist()
+        expire_seconds = self.minutes_to_expire * 60
+
+        # Runnerの状態
+        current_position: float = 0
+        exit_time = NO_EXIT_TIME
+        # 発注済みだが未約定の注文
+        pending = False
+        p_time = 0
+        p_side: Side = "BUY"
+        p_size = 0.0
+        p_price = float("nan")
+
+        i = 0
+        while i < n:
+            now = times[i]
+            if pending:
+                # BackTester.handle_ordersと同じ順序で判定する
+                is_market = math.isnan(p_price)
+                if now - p_time >= expire_seconds:
+                    self.orders.append(OrderLog(p_time, p_side, p_size, now, "expired"))
+                    pending = False
+                else:
+                    if is_market:
+                        if p_side == "BUY":
+                            price = round(close[i] * (1 + self.slippage))
+                        else:
+                            price = round(close[i] * (1 - self.slippage))
+                    else:
+                        price = p_price
+                    if p_side == "BUY":
+                        is_valid = self.cash - price * p_size >= 0
+                    else:
+                        is_valid = self.position - p_size >= 0
+
+                    if not is_valid:
+                        self.orders.append(
+                            OrderLog(p_time, p_side, p_size, now, "invalid")
+                        )
+                        pending = False
+                    elif is_market or (price > low[i]) or (price < high[i]):
+                        if p_side == "BUY":
+                            cash_diff = price * p_size * (-1)
+                            position_diff = p_size
+                        else:
+                            cash_diff = price * p_size
+                            position_diff = p_size * (-1)
+                        self.cash += cash_diff
+                        self.position += position_diff
+                        self._change_idx.append(i)
+                        self._change_cash.append(self.cash)
+                        self._change_position.append(self.position)
+                        self.orders.append(
+                            OrderLog(
+                                p_time,
+                                p_side,
+                                p_size,
+                                now,
+                                "executed",
+                                cash_diff,
+                                position_diff,
+                            )
+                        )
+                        current_position += position_diff
+                        pending = False
+                if pending:
+                    i += 1
+                    continue
+
+            if abs(current_position) * close[i] < THRESHOLD:
+                # ポジション作成
+                exit_time = NO_EXIT_TIME
+                if side_l[i] != 0:
+                    p_size = self.cash * size_fraction[i] / close[i]
+                    if p_size <= 0:
+                        raise ValueError("size must be a positive number.")
+                    p_side = "BUY" if side_l[i] > 0 else "SELL"
+                    p_price = limit_price[i]
+                    p_time = now
+                    pending = True
+                    exit_time = now + exit_offset[i]
+                    i += 1
+                    continue
+                i = self._next_flat_event(i + 1, current_position, signal_idx)
+            else:
+                # 手仕舞い
+                if exit_time != NO_EXIT_TIME and exit_time > now:
+                    i = self._next_holding_event(i + 1, current_position, exit_time)
+                    continue
+                p_side = "SELL" if current_position > 0 else "BUY"
+                p_size = abs(current_position)
+                p_price = float("nan")
+                p_time = now
+                pending = True
+                i += 1
+
+    def _next_flat_event(
+        self, start: int, current_position: float, signal_idx: np.ndarray
+    ) -> int:
+        # ポジションなしの間は, 次のシグナルかポジションありとみなされるバーまで飛ばす
+        k = np.searchsorted(signal_idx, start)
+        end = int(signal_idx[k]) if k < len(signal_idx) else len(self)
+        if current_position == 0:
+            return end
+        hit = np.flatnonzero(abs(current_position) * self.close[start:end] >= THRESHOLD)
+        return start + int(hit[0]) if len(hit) else end
+
+    def _next_holding_event(
+        self, start: int, current_position: float, exit_time: int
+    ) -> int:
+        # 手仕舞い時刻か, ポジションなしとみなされるバーまで飛ばす
+        end = int(np.searchsorted(self.times, exit_time, side="left"))
+        end = max(start, min(end, len(self)))
+        hit = np.flatnonzero(abs(current_position) * self.close[start:end] < THRESHOLD)
+        return start + int(hit[0]) if len(hit) else end
+
+    @property
+    def snapshots(self) -> pd.DataFrame:
+        lengths = np.diff(np.append(self._change_idx, len(self)))
+        cash = np.repeat(np.asarray(self._change_cash, dtype=np.float64), lengths)
+        position = np.repeat(
+            np.asarray(self._change_position, dtype=np.float64), lengths
+        )
+        return pd.DataFrame(
+            {
+                "cash": cash,
+                "position": position,
+                "valuation": position * self.close + cash,
+            },
+            index=self.index.rename("timestamp"),
+        )
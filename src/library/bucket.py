@@ -0,0 +1,119 @@
+import io
+from abc import ABCMeta, abstractmethod
+from pathlib import Path
+from typing import Any
+
+
+class AbstractBucket(metaclass=ABCMeta):
+    """
+    オブジェクトストレージの最小限の操作. 名前は"data/btf_periods60.csv"のような/区切り.
+    """
+
+    @abstractmethod
+    def download(self, name: str) -> bytes | None:
+        """
+        オブジェクトの中身. 存在しなければNone.
+        """
+        pass
+
+    def download_tail(self, name: str, n_bytes: int) -> bytes | None:
+        """
+        オブジェクトの末尾n_bytes(全体がそれより短ければ全体). 存在しなければNone.
+        範囲指定でダウンロードできるバケットはオーバーライドする.
+        """
+        data = self.download(name)
+        return None if data is None else data[-n_bytes:]
+
+    @abstractmethod
+    def upload(self, name: str, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        pass
+
+    @abstractmethod
+    def list(self, prefix: str) -> list[str]:
+        """
+        prefixで始まるオブジェクトの名前(昇順)
+        """
+        pass
+
+
+class GCSBucket(AbstractBucket):
+    """
+    Google Cloud Storageのバケット. clientを渡せば全ての操作で使い回す.
+    """
+
+    def __init__(self, bucket_name: str, client: Any = None) -> None:
+        # Cloud Functions以外からも使えるよう, 使う時にだけimportする
+        from google.cloud.storage import Client
+
+        self.client = client or Client()
+        self.bucket = self.client.bucket(bucket_name)
+
+    def download(self, name: str) -> bytes | None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(name).download_as_bytes()
+        except NotFound:
+            return None
+
+    def download_tail(self, name: str, n_bytes: int) -> bytes | None:
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        return blob.download_as_bytes(start=max(0, blob.size - n_bytes))
+
+    def upload(self, name: str, data: bytes) -> None:
+        self.bucket.blob(name).upload_from_string(data)
+
+    def delete(self, name: str) -> None:
+        self.bucket.blob(name).delete()
+
+    def list(self, prefix: str) -> list[str]:
+        return sorted(
+            blob.name for blob in self.client.list_blobs(self.bucket, prefix=prefix)
+        )
+
+
+class LocalBucket(AbstractBucket):
+    """
+    ローカルのディレクトリをバケットに見立てる. テストや手元での確認用.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def download(self, name: str) -> bytes | None:
+        path = self.root / name
+        return path.read_bytes() if path.exists() else None
+
+    def download_tail(self, name: str, n_bytes: int) -> bytes | None:
+        path = self.root / name
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            size = f.seek(0, io.SEEK_END)
+            f.seek(max(0, size - n_bytes))
+            return f.read()
+
+    def upload(self, name: str, data: bytes) -> None:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def delete(self, name: str) -> None:
+        (self.root / name).unlink()
+
+    def list(self, prefix: str) -> list[str]:
+        names = (
+            path.relative_to(self.root).as_posix()
+            for path in self.root.rglob("*")
+            if path.is_file() and not path.name.endswith(".tmp")
+        )
+        return sorted(name for name in names if name.startswith(prefix))
@@ -0,0 +1,35 @@
+import pickle
+from pathlib import Path
+
+from library.runner import Runner
+
+
+def save_checkpoint(path: str | Path, runner: Runner) -> None:
+    """
+    Runnerとそのtesterの状態をpickleで保存する. 書き込み途中で落ちても壊れないよう置き換える.
+    """
+    path = Path(path)
+    runner.tester.recorder.flush()
+    state = {"tester": runner.tester.get_state(), "runner": runner.get_state()}
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+
+
+def load_checkpoint(path: str | Path, runner: Runner) -> bool:
+    """
+    保存した状態をrunnerに読み込む. 続けてrunner.run()を呼ぶと, 新しいバーだけを処理する.
+    runnerは, 保存時のデータの末尾に新しいバーを足したデータで作り直したもの.
+
+    Returns:
+        bool: チェックポイントがあればTrue.
+    """
+    path = Path(path)
+    if not path.exists():
+        return False
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    runner.tester.set_state(state["tester"])
+    runner.set_state(state["runner"])
+    return True
@@ -1,18 +1,50 @@
 import datetime as dt
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
 
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
+from library import csv_tail
 
-def get_data(periods: int, before: dt.datetime, after: dt.datetime) -> list[list]:
+# Cloud Functionsの起動を速くするため, numpyを使うstorageは使う時にだけimportする
+if TYPE_CHECKING:
+    from library.storage import OHLCVStore
+
+BASE_URL = "https://api.cryptowat.ch/markets/bitflyer/btcjpy/ohlc"
+MAX_BARS = 6000  # 1回のリクエストで取得できる最大件数
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """コネクションを使い回すためのSessionを作る.
+
+    Args:
+        pool_size (int): 同時に張るコネクションの上限.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=3)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_data(
+    periods: int,
+    before: dt.datetime,
+    after: dt.datetime,
+    session: requests.Session | None = None,
+    base_url: str = BASE_URL,
+) -> list[list]:
     """cryptowatchからデータを取得する.
 
     Args:
         periods (int): 足を指定. Ex. 15分足: 900, 日足: 86400
         before (dt.datetime): before以前のデータを取得.
         after (dt.datetime): after以降のデータを取得.
+        session (requests.Session | None): 指定すればコネクションを使い回す.
+        base_url (str): APIのURL.
 
     Returns:
         List[list]: サイズ(7, min(length, 6000))のリスト.
@@ -23,9 +55,9 @@ def get_data(periods: int, before: dt.datetime, after: dt.datetime) -> list[list
     # # 例えばperiods=900(15分足), beforeがちょうど17:00:00だった場合, 16:45~17:00のデータが入る.
     # # afterについて, afterがちょうど16:30:00だった場合, 16:15~16:30のデータが入る.
     # UNIXに直す必要があり, timestamp()メソッドを使っている.
-    response = requests.get(
-        "https://api.cryptowat.ch/markets/bitflyer/btcjpy/"
-        + f"ohlc?periods={periods}&before={int(before.timestamp())}"
+    response = (session or requests).get(
+        base_url
+        + f"?periods={periods}&before={int(before.timestamp())}"
         + f"&after={int(after.timestamp())}"
     )
     response_ = response.json()
@@ -39,6 +71,71 @@ def get_data(periods: int, before: dt.datetime, after: dt.datetime) -> list[list
     return data
 
 
+def split_windows(
+    periods: int, before: dt.datetime, after: dt.datetime
+) -> list[tuple[dt.datetime, dt.datetime]]:
+    """[after, before]を, 1回のリクエストで取得できる長さの区間に分ける.
+
+    Returns:
+        list[tuple[dt.datetime, dt.datetime]]: (after, before)のリスト. 古い順.
+    """
+    span = dt.timedelta(seconds=periods * (MAX_BARS - 1))
+    windows = []
+    # CloseTimeはperiodsの倍数なので, afterを切り上げて各区間の端を足の時刻に揃える.
+    # 揃えないと区間の境目(window_before, window_before + periods)の足が抜ける
+    window_after = dt.datetime.fromtimestamp(
+        -(-int(after.timestamp()) // periods) * periods
+    )
+    while window_after <= before:
+        window_before = min(window_after + span, before)
+        windows.append((window_after, window_before))
+        window_after = window_before + dt.timedelta(seconds=periods)
+    return windows
+
+
+def stitch(chunks: Iterable[list[list]]) -> list[list]:
+    """区間ごとに取得したデータをCloseTimeで重複を除いて昇順に並べる."""
+    merged = {row[0]: row for chunk in chunks for row in chunk}
+    return [merged[close_time] for close_time in sorted(merged)]
+
+
+def backfill(
+    periods: int,
+    before: dt.datetime,
+    after: dt.datetime,
+    max_workers: int = 4,
+    session: requests.Session | None = None,
+    base_url: str = BASE_URL,
+) -> list[list]:
+    """6000件を超える期間のデータを, 区間に分けて並列に取得する.
+
+    Args:
+        periods (int): 足を指定. Ex. 15分足: 900, 日足: 86400
+        before (dt.datetime): before以前のデータを取得.
+        after (dt.datetime): after以降のデータを取得.
+        max_workers (int): 同時リクエスト数の上限.
+        session (requests.Session | None): 使い回すSession. Noneなら新しく作る.
+        base_url (str): APIのURL.
+
+    Returns:
+        List[list]: get_dataと同じ形式. CloseTimeの昇順で重複なし.
+    """
+    windows = split_windows(periods, before, after)
+    session_ = session or make_session(pool_size=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunks = executor.map(
+                lambda window: get_data(
+                    periods, window[1], window[0], session=session_, base_url=base_url
+                ),
+                windows,
+            )
+            return stitch(chunks)
+    finally:
+        if session is None:
+            session_.close()
+
+
 def round_down_dt_by_15min(t: dt.datetime) -> dt.datetime:
     """datetimeを15分で丸める.
     Ex: 17:13 -> 17:00, 16:53 -> 16:45
@@ -50,27 +147,23 @@ def round_down_dt_by_15min(t: dt.datetime) -> dt.datetime:
     return t.replace(minute=t.minute - t.minute % 15, second=0, microsecond=0)
 
 
-COLUMNS = [
-    "CloseTime",
-    "OpenPrice",
-    "HighPrice",
-    "LowPrice",
-    "ClosePrice",
-    "Volume",
-    "QuoteVolume",
-]
-
-
-def get_new_data(periods: int, length: int, save_path: str | Path) -> None:
+def get_new_data(
+    periods: int,
+    length: int,
+    save_path: str | Path,
+    session: requests.Session | None = None,
+) -> None:
     """現在から遡ってlength件分のデータを保存する.
 
     Args:
         periods (int): 足を指定. Ex. 15分足: 900, 日足: 86400
-        length (int): データの取得件数, <=6000 (一度に6000件までしか取得できない,
-        6000より大きい件数を返すよう指定してもAPIからは6000件しか返ってこない)
-        save_path (str): 保存場所.
+        length (int): データの取得件数. 6000件を超える場合はbackfillで分割して取得する.
+        save_path (str): 保存場所. 拡張子が.ohlcvならOHLCVStore, それ以外はcsvで保存する.
+        session (requests.Session | None): 使い回すSession.
 
     """
+    from library.storage import OHLCVStore, is_store_path
+
     # save_pathが既に存在している場合, 何もしない
     if os.path.exists(save_path):
         print("File already exists.")
@@ -81,15 +174,19 @@ def get_new_data(periods: int, length: int, save_path: str | Path) -> None:
     after = before - dt.timedelta(seconds=periods * length)
 
     # データ取得
-    data = get_data(periods, before, after)
+    data = backfill(periods, before, after, session=session)
     print(
         f"Data from {dt.datetime.fromtimestamp(data[0][0])} to "
         + f"{dt.datetime.fromtimestamp(data[-1][0])} are saved"
     )
 
-    # dataframeにして保存
-    df = pd.DataFrame(data, columns=COLUMNS)
-    df.to_csv(save_path, index=False)
+    if is_store_path(save_path):
+        OHLCVStore(save_path).append(data)
+        return None
+
+    # csvで保存
+    with open(save_path, "w", newline="") as f:
+        f.write(csv_tail.format_rows(data))
 
 
 def add_data(periods: int, save_path: str | Path) -> None:
@@ -97,18 +194,26 @@ def add_data(periods: int, save_path: str | Path) -> None:
 
     Args:
         periods (int): Ex. 15分足: 900, 日足: 86400
-        save_path (str): 保存場所.
+        save_path (str): 保存場所. 拡張子が.ohlcvならOHLCVStoreの末尾に追記する.
 
     """
-    old_df = pd.read_csv(save_path)
+    from library.storage import OHLCVStore, is_store_path
+
+    if is_store_path(save_path):
+        add_data_to_store(periods=periods, store=OHLCVStore(save_path))
+        return None
+
+    # csv全体は読まず, 末尾の行から最新の時刻を調べる
+    last_close_time = csv_tail.last_close_time(save_path)
+    if last_close_time is None:
+        raise ValueError(f"{save_path} is empty. Use get_new_data first.")
     # csvファイル上の最新の時刻(+periods)から現時点までのデータを取得
     before = dt.datetime.now()
-    after = dt.datetime.fromtimestamp(old_df["CloseTime"].values[-1]) + dt.timedelta(
-        seconds=periods
-    )
+    after = dt.datetime.fromtimestamp(last_close_time) + dt.timedelta(seconds=periods)
 
     # データ取得
     data = get_data(periods, before, after)
+    data = [row for row in data if row[0] > last_close_time]
     if len(data) == 0:
         print("There's nothing to do.")
         return None
@@ -118,18 +223,57 @@ def add_data(periods: int, save_path: str | Path) -> None:
         f"{dt.datetime.fromtimestamp(data[-1][0])} are saved"
     )
 
-    # 既存のdataと結合して保存
-    tmp_df = pd.DataFrame(data, columns=COLUMNS)
-    new_df = pd.concat([old_df, tmp_df])
-    new_df.to_csv(save_path, index=False)
+    # 既存のcsvの末尾に追記する
+    csv_tail.append_rows(save_path, data)
+    first_close_time = csv_tail.first_close_time(save_path) or data[0][0]
     print(
         f"Now btf_periods{periods}.csv contain data "
-        + f"from {dt.datetime.fromtimestamp(new_df['CloseTime'].values[0])} "
-        + f"to {dt.datetime.fromtimestamp(new_df['CloseTime'].values[-1])}"
+        + f"from {dt.datetime.fromtimestamp(first_close_time)} "
+        + f"to {dt.datetime.fromtimestamp(data[-1][0])}"
+    )
+
+
+def add_data_to_store(periods: int, store: "OHLCVStore") -> None:
+    """OHLCVStoreに最新のデータを追記する. 既存のデータは読み直さない.
+
+    Args:
+        periods (int): Ex. 15分足: 900, 日足: 86400
+        store (OHLCVStore): 追記先.
+
+    """
+    last_close_time = store.last_close_time()
+    if last_close_time is None:
+        raise ValueError(f"{store.path} is empty. Use get_new_data first.")
+    before = dt.datetime.now()
+    after = dt.datetime.fromtimestamp(last_close_time) + dt.timedelta(seconds=periods)
+
+    data = get_data(periods, before, after)
+    num_appended = store.append(data)
+    if num_appended == 0:
+        print("There's nothing to do.")
+        return None
+
+    records = store.records()
+    print(
+        f"{num_appended} bars are appended. Now {store.path.name} contain data "
+        + f"from {dt.datetime.fromtimestamp(int(records['CloseTime'][0]))} "
+        + f"to {dt.datetime.fromtimestamp(int(records['CloseTime'][-1]))}"
     )
 
 
 if __name__ == "__main__":
-    for period in [60, 300, 900, 3600, 86400]:
-        save_path = f"../input_data/btf_periods{period}.csv"
-        get_new_data(periods=period, length=6000, save_path=save_path)
+    periods_list = [60, 300, 900, 3600, 86400]
+    with make_session(pool_size=len(periods_list)) as session:
+        with ThreadPoolExecutor(max_workers=len(periods_list)) as executor:
+            # 例外を握りつぶさないよう結果を回収する
+            list(
+                executor.map(
+                    lambda period: get_new_data(
+                        periods=period,
+                        length=6000,
+                        save_path=f"../input_data/btf_periods{period}.csv",
+                        session=session,
+                    ),
+                    periods_list,
+                )
+            )
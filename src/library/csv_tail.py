@@ -0,0 +1,187 @@
+"""
+btf_periods*.csvの末尾だけを扱う軽量な処理. 起動を速くするためpandas/numpyは使わない.
+途中への挿入も, 挿入する位置より後ろだけを書き直す.
+"""
+
+import csv
+import io
+from pathlib import Path
+from typing import Iterable, Sequence
+
+COLUMNS = [
+    "CloseTime",
+    "OpenPrice",
+    "HighPrice",
+    "LowPrice",
+    "ClosePrice",
+    "Volume",
+    "QuoteVolume",
+]
+BLOCK_SIZE = 4096  # 末尾から読むときの最初の大きさ[byte]
+
+
+def parse_close_time(line: bytes) -> int | None:
+    """
+    1行のCloseTime. ヘッダーや壊れた行ならNone.
+    """
+    field = line.split(b",", 1)[0].strip()
+    try:
+        return int(field)
+    except ValueError:
+        pass
+    try:
+        value = float(field)
+    except ValueError:
+        return None
+    return int(value) if value.is_integer() else None
+
+
+def last_close_time_in(data: bytes, is_head: bool = True) -> int | None:
+    """
+    csvの一部(末尾)の中で最後の有効な行のCloseTime.
+
+    Args:
+        data (bytes): csvの末尾.
+        is_head (bool): dataがファイルの先頭から始まるか. Falseなら最初の行は途中から
+            なので使わない.
+    """
+    lines = data.splitlines()
+    if not is_head:
+        lines = lines[1:]
+    for line in reversed(lines):
+        close_time = parse_close_time(line)
+        if close_time is not None:
+            return close_time
+    return None
+
+
+def last_close_time(path: str | Path) -> int | None:
+    """
+    csvの最後の有効な行のCloseTime. ファイルの末尾から必要な分だけ読む.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, io.SEEK_END)
+        block = BLOCK_SIZE
+        while True:
+            start = max(0, size - block)
+            f.seek(start)
+            close_time = last_close_time_in(f.read(size - start), is_head=start == 0)
+            if close_time is not None or start == 0:
+                return close_time
+            block *= 2
+
+
+def offset_after(path: str | Path, close_time: int) -> int:
+    """
+    CloseTimeがclose_timeより後の行が始まる位置[byte]. ファイルの末尾から必要な分だけ読む.
+    close_time以前の行がなければ0(ファイル全体).
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, io.SEEK_END)
+        block = BLOCK_SIZE
+        while True:
+            start = max(0, size - block)
+            f.seek(start)
+            lines = f.read(size - start).splitlines(keepends=True)
+            position = start
+            if start > 0 and lines:
+                # 最初の行は途中からなので使わない
+                position += len(lines[0])
+                lines = lines[1:]
+            offset = None
+            for line in lines:
+                position += len(line)
+                line_close_time = parse_close_time(line)
+                if line_close_time is not None and line_close_time <= close_time:
+                    offset = position
+            if offset is not None:
+                return offset
+            if start == 0:
+                return 0
+            block *= 2
+
+
+def first_close_time(path: str | Path) -> int | None:
+    """
+    csvの最初の有効な行のCloseTime. 先頭から1行ずつ読む.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            close_time = parse_close_time(line)
+            if close_time is not None:
+                return close_time
+    return None
+
+
+def format_rows(rows: Iterable[Sequence], header: bool = True) -> str:
+    """
+    get_dataの戻り値をcsvの文字列にする. 列はCOLUMNSの順で, 値はAPIが返した形のまま書く.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def append_rows(path: str | Path, rows: Iterable[Sequence]) -> None:
+    """
+    既存のcsvの末尾に行を追記する. ファイル全体は読み直さない.
+    """
+    with open(path, "rb+") as f:
+        # 最後の行が改行で終わっていなければ補う
+        size = f.seek(0, io.SEEK_END)
+        if size > 0:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    with open(path, "a", newline="") as f:
+        f.write(format_rows(rows, header=False))
+
+
+def insert_rows(path: str | Path, rows: Iterable[Sequence]) -> int:
+    """
+    まだないCloseTimeの行を昇順の位置に挿入し, 挿入した行数を返す.
+    最初に挿入する位置より前の部分は書き換えず, 後ろの既存の行はそのままの文字列で書き直す.
+    """
+    new_rows = sorted({row[0]: row for row in rows}.values(), key=lambda row: row[0])
+    if len(new_rows) == 0:
+        return 0
+    with open(path, "rb+") as f:
+        offset = 0
+        for line in f:
+            close_time = parse_close_time(line)
+            if close_time is not None and close_time >= new_rows[0][0]:
+                break
+            offset += len(line)
+        f.seek(offset)
+        tail = f.read().splitlines(keepends=True)
+        existing = {parse_close_time(line) for line in tail}
+        new_rows = [row for row in new_rows if row[0] not in existing]
+        if len(new_rows) == 0:
+            return 0
+
+        # 既存の行とCloseTimeの順に合流させる. 数値でない行はその場に残す
+        new_lines = format_rows(new_rows, header=False).splitlines(keepends=True)
+        merged: list[bytes] = []
+        i = 0
+        for line in tail:
+            close_time = parse_close_time(line)
+            while close_time is not None and i < len(new_rows):
+                if new_rows[i][0] > close_time:
+                    break
+                merged.append(new_lines[i].encode())
+                i += 1
+            merged.append(line if line.endswith(b"\n") else line + b"\n")
+        merged += [line.encode() for line in new_lines[i:]]
+
+        if offset > 0 and len(tail) == 0:
+            # 末尾への挿入で, 最後の行が改行で終わっていなければ補う
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                merged.insert(0, b"\n")
+        f.seek(offset)
+        f.write(b"".join(merged))
+        f.truncate()
+    return len(new_rows)
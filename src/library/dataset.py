@@ -0,0 +1,153 @@
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from library.feature_extractor import FeaturePlanner, MyTAStratSet
+
+
+class Fold(NamedTuple):
+    """
+    1回分の学習/検証データ. 配列は全て元の行列のview(コピーではない).
+    iter_frame_foldsでラベルの列が途中にある場合だけ, x_train, x_testはそのfoldのコピー.
+    """
+
+    fold: int
+    train: slice
+    test: slice
+    x_train: np.ndarray
+    y_train: np.ndarray
+    x_test: np.ndarray
+    y_test: np.ndarray
+
+
+def walk_forward_splits(
+    n_samples: int,
+    n_folds: int,
+    embargo: int,
+    label_horizon: int = 1,
+    test_size: int | None = None,
+    max_train_size: int | None = None,
+) -> list[tuple[slice, slice]]:
+    """
+    時系列を前から順に学習に使い, その直後の区間で検証するwalk-forwardの分割.
+    検証区間は末尾からn_folds個並べ, 学習区間は検証区間の直前で
+
+    - パージ: ラベルが検証区間の値を使う行(label_horizon本)
+    - エンバーゴ: 特徴量の計算期間が重なる行(embargo本)
+
+    を除いて終わる.
+
+    Args:
+        n_samples (int): 行数.
+        n_folds (int): 分割数.
+        embargo (int): Ex. MyTAStratSet.max_length
+        label_horizon (int): ラベルが何本先までの値を使うか. Ex. pct_change().shift(-1)なら1.
+        test_size (int | None): 検証区間の長さ. Noneならn_samples // (n_folds + 1).
+        max_train_size (int | None): 学習区間の最大の長さ. Noneなら先頭から全て使う.
+
+    Returns:
+        list[tuple[slice, slice]]: (学習区間, 検証区間)のリスト.
+    """
+    if test_size is None:
+        test_size = n_samples // (n_folds + 1)
+    gap = label_horizon + embargo
+    first_test_start = n_samples - n_folds * test_size
+    if test_size <= 0 or first_test_start - gap <= 0:
+        raise ValueError(
+            f"Not enough samples ({n_samples}) for {n_folds} folds "
+            f"with test_size={test_size} and gap={gap}."
+        )
+
+    splits = []
+    for k in range(n_folds):
+        test_start = first_test_start + k * test_size
+        train_end = test_start - gap
+        train_start = (
+            0 if max_train_size is None else max(0, train_end - max_train_size)
+        )
+        splits.append(
+            (slice(train_start, train_end), slice(test_start, test_start + test_size))
+        )
+    return splits
+
+
+def iter_folds(
+    x: np.ndarray,
+    y: np.ndarray,
+    n_folds: int,
+    embargo: int,
+    label_horizon: int = 1,
+    test_size: int | None = None,
+    max_train_size: int | None = None,
+) -> Iterator[Fold]:
+    """
+    walk_forward_splitsの区間で, 1 foldずつ学習/検証データを返す.
+    スライスはviewなので, xがnp.memmapなら読み込まれるのはそのfoldの範囲だけ.
+
+    Args:
+        x (np.ndarray): 特徴量の行列. (n_samples, n_features)
+        y (np.ndarray): ラベル. (n_samples,)
+        その他はwalk_forward_splitsと同じ.
+    """
+    if len(x) != len(y):
+        raise ValueError(f"Length mismatch: x has {len(x)} rows, y has {len(y)}.")
+    splits = walk_forward_splits(
+        len(x),
+        n_folds,
+        embargo,
+        label_horizon=label_horizon,
+        test_size=test_size,
+        max_train_size=max_train_size,
+    )
+    for k, (train, test) in enumerate(splits):
+        yield Fold(k, train, test, x[train], y[train], x[test], y[test])
+
+
+def iter_frame_folds(
+    df: pd.DataFrame,
+    label_column: str,
+    n_folds: int,
+    strat_set: MyTAStratSet | FeaturePlanner,
+    label_horizon: int = 1,
+    test_size: int | None = None,
+    max_train_size: int | None = None,
+) -> Iterator[Fold]:
+    """
+    特徴量のDataFrameからfoldを作る. エンバーゴには特徴量の最大のlengthを使う.
+    dfが1つのfloat64の行列を包んでいる場合(Ex. FeatureCache.get_featuresのmemmap)は
+    全体をコピーせず, ラベルの列が先頭か末尾なら特徴量も列のviewで返す.
+    ラベルの列が途中にある場合は, fold毎にその区間の特徴量だけをコピーする.
+
+    Args:
+        df (pd.DataFrame): 特徴量とラベルの列を持つデータ. Ex. FeatureCache.get_features
+        label_column (str): ラベルの列名. Ex. "return"
+        n_folds (int): 分割数.
+        strat_set (MyTAStratSet | FeaturePlanner): 特徴量を作ったもの. max_lengthを使う.
+    """
+    values = df.to_numpy(np.float64, copy=False)
+    j = df.columns.get_loc(label_column)
+    y = values[:, j]
+    n_columns = values.shape[1]
+    features: np.ndarray | None = None
+    if j == 0 or j == n_columns - 1:
+        # 特徴量の列が連続しているので, 列のviewで済む
+        x = values[:, 1:] if j == 0 else values[:, :j]
+    else:
+        x = values
+        features = np.delete(np.arange(n_columns), j)
+
+    for fold in iter_folds(
+        x,
+        y,
+        n_folds,
+        strat_set.max_length,
+        label_horizon=label_horizon,
+        test_size=test_size,
+        max_train_size=max_train_size,
+    ):
+        if features is not None:
+            fold = fold._replace(
+                x_train=fold.x_train[:, features], x_test=fold.x_test[:, features]
+            )
+        yield fold
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from library.feature_extractor import FeaturePlanner
+
+# [(MyTAStratSetのメソッド名, length_list), ...]
+FeatureSpec = list[tuple[str, list[int]]]
+# 指数平滑系(atr, rvi, rsi, macd)はmax_length本では収束しないので, その倍数だけ遡る.
+# 最も遅いのはatr, rsiのRMA(alpha = 1 / length)で, 遡り始めの値の影響はk本後に
+# (1 - 1 / length) ** k < exp(-k / length) まで減る. 20倍ならexp(-20) ≈ 2e-9で,
+# 追記した値と全期間から計算した値の差は指標の値の1e-8程度に収まる.
+WARMUP_MULTIPLIER = 20
+
+
+def make_planner(spec: FeatureSpec) -> FeaturePlanner:
+    planner = FeaturePlanner()
+    for set_name, length_list in spec:
+        planner.add(set_name, list(length_list))
+    return planner
+
+
+class FeatureCache:
+    """
+    特徴量行列をディスクにキャッシュする.
+    キーは (データの識別子, 特徴量の指定, パラメータ) のハッシュで, エントリごとに
+    meta.json, times.bin (int64[ns]), values.bin (float64, 行優先) を持つ.
+    新しい足が増えた場合は, 末尾とウォームアップ(max_length * WARMUP_MULTIPLIER本)だけ
+    計算し直して追記する.
+    合計サイズがmax_bytesを超えたら, 最後に使われたのが古いエントリから削除する.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 2 * 1024**3) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(source_id: str, spec: FeatureSpec, params: dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"source": source_id, "spec": spec, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _read_meta(self, entry: Path) -> dict[str, Any] | None:
+        try:
+            return json.loads((entry / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry: Path, meta: dict[str, Any]) -> None:
+        tmp = entry / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(entry / "meta.json")
+
+    def _load(self, entry: Path, meta: dict[str, Any]) -> pd.DataFrame:
+        n_rows, columns = meta["n_rows"], meta["columns"]
+        times = np.memmap(
+            entry / "times.bin", dtype=np.int64, mode="r", shape=(n_rows,)
+        )
+        values = np.memmap(
+            entry / "values.bin",
+            dtype=np.float64,
+            mode="r",
+            shape=(n_rows, len(columns)),
+        )
+        index = pd.DatetimeIndex(times.view("datetime64[ns]"), name=meta["index_name"])
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def _write(self, entry: Path, features: pd.DataFrame, n_rows: int) -> None:
+        """
+        featuresをn_rows行目から後ろに書き込む.
+        前回の追記がmeta.jsonの更新前に中断していると, ファイルにはmetaより多くの行が
+        残っているので, 先にn_rows行に切り詰める.
+        """
+        times = features.index.values.astype("datetime64[ns]").astype(np.int64)
+        values = np.ascontiguousarray(features.to_numpy(dtype=np.float64))
+        for name, array in [("times.bin", times), ("values.bin", values)]:
+            path = entry / name
+            row_bytes = array.itemsize * int(np.prod(array.shape[1:]))
+            with open(path, "r+b" if n_rows > 0 else "wb") as f:
+                f.truncate(n_rows * row_bytes)
+                f.seek(n_rows * row_bytes)
+                array.tofile(f)
+
+    def get_features(
+        self,
+        df: pd.DataFrame,
+        source_id: str,
+        spec: FeatureSpec,
+        **params: Any,
+    ) -> pd.DataFrame:
+        """
+        dfの特徴量行列を返す. キャッシュがあれば読み込み, 足りない末尾だけ計算して追記する.
+
+        Args:
+            df (pd.DataFrame): indexが"timestamp"のohlcv. 古いデータは変わらず末尾に追加されていく前提.
+            source_id (str): データの識別子. Ex. csvのパス.
+            spec (FeatureSpec): Ex. [("roc", [5, 10]), ("vola", [5, 10])]
+            **params: キーに含めるその他のパラメータ.
+                warmup (int)を指定するとウォームアップの本数を変えられる.
+        """
+        key = self.make_key(source_id, spec, params)
+        entry = self.cache_dir / key
+        meta = self._read_meta(entry)
+        planner = make_planner(spec)
+        warmup = int(params.get("warmup", planner.max_length * WARMUP_MULTIPLIER))
+
+        start = 0  # ここから後ろを追記する
+        if meta is not None:
+            n_rows = meta["n_rows"]
+            last_time = np.datetime64(meta["last_time"], "ns")
+            is_prefix = n_rows <= len(df) and (
+                n_rows == 0 or df.index.values[n_rows - 1] == last_time
+            )
+            if is_prefix:
+                start = n_rows
+            else:
+                # 既存のデータが書き換わっているので作り直す
+                shutil.rmtree(entry)
+                meta = None
+
+        if meta is None or start < len(df):
+            entry.mkdir(exist_ok=True)
+            window_start = max(0, start - warmup)
+            computed = planner.compute(df.iloc[window_start:]).iloc[
+                start - window_start :
+            ]
+            self._write(entry, computed, n_rows=start)
+            meta = {
+                "source_id": source_id,
+                "spec": spec,
+                "params": params,
+                "columns": [str(column) for column in computed.columns],
+                "index_name": df.index.name,
+                "n_rows": len(df),
+                "last_time": str(df.index.values[-1].astype("datetime64[ns]")),
+                "report": {k: v for k, v in planner.report.items() if k != "skipped"},
+            }
+
+        meta["last_access"] = time.time()
+        self._write_meta(entry, meta)
+        self.evict()
+        return self._load(entry, meta)
+
+    def entries(self) -> list[tuple[Path, dict[str, Any], int]]:
+        result = []
+        for entry in self.cache_dir.iterdir():
+            meta = self._read_meta(entry) if entry.is_dir() else None
+            if meta is None:
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            result.append((entry, meta, size))
+        return result
+
+    def evict(self) -> None:
+        """
+        合計サイズがmax_bytes以下になるまで, 古いエントリから削除する
+        """
+        entries = sorted(self.entries(), key=lambda e: e[1].get("last_access", 0))
+        total = sum(size for _, _, size in entries)
+        # 直前に使ったエントリ(最後の1つ)は残す
+        for entry, _, size in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry)
+            total -= size
@@ -2,6 +2,7 @@ from typing import Any
 
 import numpy as np
 import pandas as pd
+import pandas_ta  # noqa: F401  DataFrame.taを登録する
 
 
 # テクニカル指標を計算する
@@ -102,28 +103,260 @@ class MyTAStratSet:
         return strats
 
 
+class FeaturePlanner:
+    """
+    MyTAStratSetの特徴量セットをまとめて受け取り, 依存関係のDAGを作ってから計算する.
+    - 同じ指標(kindもパラメータも入力列も同じもの)は1回だけ計算する
+    - sma, rocは同じ入力列の全lengthをnumpyでまとめて計算する
+    - 他の特徴量の入力にしか使われない中間列は最後に削除する
+    """
+
+    VECTORIZED_KINDS = ("sma", "roc")
+
+    def __init__(self) -> None:
+        self.stratset = MyTAStratSet()
+        # 重複を除いた指標. key -> pandas_taの引数
+        self._nodes: dict[tuple, dict[str, Any]] = {}
+        # 1つでも中間列扱いでないセットから要求された指標
+        self._keep: set[tuple] = set()
+        self.num_requested = 0
+        self.skipped: list[dict[str, Any]] = []  # 重複のため計算を省いた指標
+
+    @property
+    def max_length(self) -> int:
+        return self.stratset.max_length
+
+    @staticmethod
+    def _key(strat: dict[str, Any]) -> tuple:
+        return tuple(sorted(strat.items()))
+
+    @staticmethod
+    def column_name(strat: dict[str, Any]) -> str | None:
+        """
+        sma, rocの出力列名(pandas_taと同じ). それ以外はNone.
+        """
+        if strat["kind"] not in FeaturePlanner.VECTORIZED_KINDS:
+            return None
+        name = f"{strat['kind'].upper()}_{strat['length']}"
+        prefix = strat.get("prefix")
+        return f"{prefix}_{name}" if prefix else name
+
+    def add(self, set_name: str, length_list: list[int]) -> "FeaturePlanner":
+        """
+        Ex. planner.add("sma_roc", [5, 10]) でMyTAStratSet.sma_rocの指標を追加する.
+        """
+        num_unnecessary = len(self.stratset.unnecessary_cols)
+        strats = getattr(self.stratset, set_name)(length_list)
+        unnecessary = set(self.stratset.unnecessary_cols[num_unnecessary:])
+        for strat in strats:
+            self.num_requested += 1
+            key = self._key(strat)
+            if key in self._nodes:
+                self.skipped.append(strat)
+            else:
+                self._nodes[key] = strat
+            if self.column_name(strat) not in unnecessary:
+                self._keep.add(key)
+        return self
+
+    @property
+    def report(self) -> dict[str, Any]:
+        return {
+            "requested": self.num_requested,
+            "computed": len(self._nodes),
+            "skipped": self.skipped,
+            "dropped": [
+                self.column_name(strat)
+                for key, strat in self._nodes.items()
+                if key not in self._keep
+            ],
+        }
+
+    def _levels(self, columns: set[str]) -> list[list[dict[str, Any]]]:
+        """
+        入力列が揃った順に指標を並べる(トポロジカルソート)
+        """
+        available = set(columns)
+        remaining = list(self._nodes.values())
+        levels = []
+        while remaining:
+            level = [
+                strat
+                for strat in remaining
+                if all(
+                    strat.get(arg, arg) in available
+                    for arg in ("close", "open_")
+                    if arg in strat
+                )
+            ]
+            if not level:
+                raise ValueError(f"unresolved inputs: {remaining}")
+            levels.append(level)
+            remaining = [strat for strat in remaining if strat not in level]
+            available |= {
+                name for name in map(self.column_name, level) if name is not None
+            }
+        return levels
+
+    def compute(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        dfに特徴量の列を加えたDataFrameを返す. dfは変更しない.
+        """
+        source = {column: df[column] for column in df.columns}
+        features: dict[str, pd.Series] = {}
+        for level in self._levels(set(df.columns)):
+            # sma, rocは入力列ごとにまとめて計算する
+            groups: dict[tuple, list[dict[str, Any]]] = {}
+            for strat in level:
+                if strat["kind"] in self.VECTORIZED_KINDS:
+                    group_key = (strat["kind"], strat["close"], strat.get("prefix"))
+                    groups.setdefault(group_key, []).append(strat)
+                else:
+                    inputs = [strat[arg] for arg in ("close", "open_") if arg in strat]
+                    frame = df
+                    if not set(inputs) <= set(df.columns):
+                        frame = pd.DataFrame(source, index=df.index)
+                    result = getattr(frame.ta, strat["kind"])(
+                        **{k: v for k, v in strat.items() if k != "kind"}
+                    )
+                    if isinstance(result, pd.DataFrame):
+                        features.update({c: result[c] for c in result.columns})
+                    else:
+                        features[result.name] = result
+
+            for (kind, close, _), strats in groups.items():
+                x = source[close].to_numpy(dtype=np.float64)
+                lengths = [strat["length"] for strat in strats]
+                values = (
+                    rolling_mean(x, lengths)
+                    if kind == "sma"
+                    else rate_of_change(x, lengths)
+                )
+                for strat, value in zip(strats, values):
+                    name = self.column_name(strat)
+                    assert name is not None
+                    features[name] = source[name] = pd.Series(
+                        value, index=df.index, name=name
+                    )
+
+        dropped = set(self.report["dropped"])
+        kept = {name: s for name, s in features.items() if name not in dropped}
+        return pd.concat([df, pd.DataFrame(kept, index=df.index)], axis=1)
+
+
+def rolling_mean(x: np.ndarray, lengths: list[int]) -> list[np.ndarray]:
+    """
+    累積和を1回だけ取り, 全lengthの移動平均を計算する. NaNを含む窓はNaNになる(pandasと同じ).
+    """
+    is_nan = ~np.isfinite(x)
+    # 桁落ちを抑えるため, 最初の値を引いてから累積和を取る
+    offset = x[~is_nan][0] if not np.all(is_nan) else 0.0
+    cumsum = np.concatenate([[0.0], np.cumsum(np.where(is_nan, 0.0, x - offset))])
+    nan_count = np.concatenate([[0], np.cumsum(is_nan)])
+    results = []
+    for length in lengths:
+        mean = np.full(len(x), np.nan)
+        if length <= len(x):
+            window_sum = cumsum[length:] - cumsum[:-length]
+            has_nan = (nan_count[length:] - nan_count[:-length]) > 0
+            mean[length - 1 :] = np.where(has_nan, np.nan, window_sum / length + offset)
+        results.append(mean)
+    return results
+
+
+def rate_of_change(x: np.ndarray, lengths: list[int]) -> list[np.ndarray]:
+    """
+    pandas_ta.rocと同じく, length本前からの変化率(%)
+    """
+    results = []
+    for length in lengths:
+        roc = np.full(len(x), np.nan)
+        if length < len(x):
+            roc[length:] = 100 * (x[length:] - x[:-length]) / x[:-length]
+        results.append(roc)
+    return results
+
+
+def rolling_std(
+    x: np.ndarray, lengths: list[int], min_periods: int = 1
+) -> list[np.ndarray]:
+    """
+    pandasのrolling(length, min_periods).std()と同じ標本標準偏差(ddof=1)を,
+    値と2乗の累積和から全length分まとめて計算する.
+    """
+    # pandasと同じく±infはNaNとして扱い, 窓の中で無視する
+    is_nan = ~np.isfinite(x)
+    offset = x[~is_nan][0] if not np.all(is_nan) else 0.0
+    centered = np.where(is_nan, 0.0, x - offset)
+    cumsum = np.concatenate([[0.0], np.cumsum(centered)])
+    cumsum_sq = np.concatenate([[0.0], np.cumsum(centered * centered)])
+    count = np.concatenate([[0], np.cumsum(~is_nan)])
+    end = np.arange(1, len(x) + 1)
+    results = []
+    for length in lengths:
+        start = np.maximum(end - length, 0)
+        n = count[end] - count[start]
+        window_sum = cumsum[end] - cumsum[start]
+        window_sum_sq = cumsum_sq[end] - cumsum_sq[start]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var = (window_sum_sq - window_sum * window_sum / n) / (n - 1)
+        # 桁落ちで負になった分は0にする
+        std = np.sqrt(np.maximum(var, 0.0))
+        results.append(np.where(n >= max(min_periods, 2), std, np.nan))
+    return results
+
+
 THRESHOLD = 0.005
+SMA_LENGTHS = [10, 20, 50]
+HV_LENGTHS = [10]
 
 
 def add_sma(df: pd.DataFrame, length: int) -> pd.DataFrame:
-    df[f"sma_{length}"] = df["close"].rolling(length).mean()
+    df[f"sma_{length}"] = rolling_mean(df["close"].to_numpy(np.float64), [length])[0]
     return df
 
 
 def add_hv(df: pd.DataFrame, length: int) -> pd.DataFrame:
-    df[f"hv_{length}"] = (
-        np.log(df["return"].astype(float) + 1.0)
-        .rolling(window=length, min_periods=1)
-        .std()
-    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_return = np.log1p(df["return"].to_numpy(np.float64))
+    df[f"hv_{length}"] = rolling_std(log_return, [length])[0]
     return df
 
 
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = add_sma(df, 10)  # FIXME pandas taを使う
-    df = add_sma(df, 20)
-    df = add_sma(df, 50)
-    df["return"] = df["close"].pct_change().shift(-1)
-    df = add_hv(df, 10)
-    df["mask"] = df["hv_10"].apply(lambda x: 1 if abs(x) > THRESHOLD else 0)
-    return df
+def add_features(
+    df: pd.DataFrame,
+    sma_lengths: list[int] = SMA_LENGTHS,
+    hv_lengths: list[int] = HV_LENGTHS,
+    dtype: np.dtype | type = np.float64,
+) -> pd.DataFrame:
+    """
+    sma_*, return, hv_*, maskを1回のパスで計算し, 1つの配列に詰めてからdfに結合する.
+
+    Args:
+        df (pd.DataFrame): "close"列を持つデータ.
+        sma_lengths (list[int]): 移動平均の期間.
+        hv_lengths (list[int]): ヒストリカルボラティリティの期間.
+            maskは先頭の期間のhvがTHRESHOLDを超えるかどうか.
+        dtype: 特徴量の型. 1分足などでメモリを節約したい場合はnp.float32.
+    """
+    close = df["close"].to_numpy(np.float64)
+    # 次の足までのリターン
+    next_return = np.full(len(close), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        next_return[:-1] = close[1:] / close[:-1] - 1.0
+        log_return = np.log1p(next_return)
+    columns = [f"sma_{length}" for length in sma_lengths] + ["return"]
+    columns += [f"hv_{length}" for length in hv_lengths]
+
+    values = np.empty((len(close), len(columns)), dtype=dtype)
+    features = rolling_mean(close, sma_lengths) + [next_return]
+    features += rolling_std(log_return, hv_lengths)
+    for j, feature in enumerate(features):
+        values[:, j] = feature
+
+    feature_df = pd.DataFrame(values, index=df.index, columns=columns, copy=False)
+    hv = features[len(sma_lengths) + 1]
+    feature_df["mask"] = (np.abs(hv) > THRESHOLD).astype(np.int64)
+    return pd.concat(
+        [df.drop(columns=columns + ["mask"], errors="ignore"), feature_df], axis=1
+    )
@@ -0,0 +1,200 @@
+"""
+保存済みのOHLCVの途中で抜けている足(gap)を見つけ, その区間だけをAPIから取り直して埋める.
+add_dataは最後のCloseTimeより後しか取得しないので, 途中の抜けはここで直す.
+"""
+
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from library import csv_tail
+from library.crawler import BASE_URL, MAX_BARS, get_data, make_session, stitch
+from library.storage import OHLCVStore, is_store_path
+
+GAP_COLUMNS = ["periods", "start", "end", "n_bars"]
+
+
+class Gap(NamedTuple):
+    """
+    抜けている足のCloseTimeの区間[start, end]. UNIXtime[s].
+    """
+
+    periods: int
+    start: int
+    end: int
+
+    @property
+    def n_bars(self) -> int:
+        return (self.end - self.start) // self.periods + 1
+
+
+def read_close_time(path: str | Path) -> np.ndarray:
+    """
+    保存済みのCloseTimeの列. 拡張子が.ohlcvならOHLCVStore, それ以外はcsvとして読む.
+    csvはCloseTimeの列だけを読み, 数値でない行は読み飛ばす.
+    """
+    if is_store_path(path):
+        return np.asarray(OHLCVStore(path).records()["CloseTime"])
+    df = pd.read_csv(path, usecols=["CloseTime"], dtype=str)
+    close_time = pd.to_numeric(df["CloseTime"], errors="coerce").dropna()
+    return close_time.to_numpy(np.int64)
+
+
+def find_gaps(close_time: np.ndarray, periods: int) -> list[Gap]:
+    """
+    CloseTimeの列から抜けている区間を探す. 重複や順序の乱れは無視する.
+
+    Args:
+        close_time (np.ndarray): UNIXtime[s].
+        periods (int): 足の長さ[s]. Ex. 15分足: 900, 日足: 86400
+
+    Returns:
+        list[Gap]: 古い順.
+    """
+    close_time = np.unique(np.asarray(close_time, dtype=np.int64))
+    (index,) = np.nonzero(np.diff(close_time) > periods)
+    starts = close_time[index] + periods
+    # 次の足の時刻がperiodsの倍数でずれていても, その手前の足までを抜けとする
+    ends = starts + (close_time[index + 1] - starts - 1) // periods * periods
+    return [Gap(periods, int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def gap_index(paths: dict[int, str | Path]) -> pd.DataFrame:
+    """
+    足ごとの抜けている区間の一覧.
+
+    Args:
+        paths (dict[int, str | Path]): {periods: 保存場所}
+
+    Returns:
+        pd.DataFrame: columnsはGAP_COLUMNS. 1行が1つのGap.
+    """
+    gaps = [
+        gap
+        for periods, path in paths.items()
+        for gap in find_gaps(read_close_time(path), periods)
+    ]
+    return pd.DataFrame(
+        [(gap.periods, gap.start, gap.end, gap.n_bars) for gap in gaps],
+        columns=GAP_COLUMNS,
+    )
+
+
+def plan_windows(gaps: list[Gap]) -> list[tuple[int, int]]:
+    """
+    Gapをリクエストの区間(after, before)にまとめる. 近いGapは1回のリクエストにまとめ,
+    1回で取得できる長さ(MAX_BARS)を超えるGapは分ける.
+    """
+    windows: list[tuple[int, int]] = []
+    for gap in sorted(gaps, key=lambda gap: gap.start):
+        span = gap.periods * (MAX_BARS - 1)
+        start = gap.start
+        if windows and gap.end - windows[-1][0] <= span:
+            windows[-1] = (windows[-1][0], gap.end)
+            continue
+        while start <= gap.end:
+            end = min(start + span, gap.end)
+            windows.append((start, end))
+            start = end + gap.periods
+    return windows
+
+
+def fetch_gaps(
+    periods: int,
+    gaps: list[Gap],
+    max_workers: int = 4,
+    session: requests.Session | None = None,
+    base_url: str = BASE_URL,
+) -> list[list]:
+    """
+    Gapの区間のデータだけを並列に取得する.
+
+    Returns:
+        List[list]: get_dataと同じ形式. CloseTimeの昇順で, Gapの中の足だけ.
+    """
+    windows = plan_windows(gaps)
+    if len(windows) == 0:
+        return []
+    session_ = session or make_session(pool_size=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunks = executor.map(
+                lambda window: get_data(
+                    periods,
+                    dt.datetime.fromtimestamp(window[1]),
+                    dt.datetime.fromtimestamp(window[0]),
+                    session=session_,
+                    base_url=base_url,
+                ),
+                windows,
+            )
+            data = stitch(chunks)
+    finally:
+        if session is None:
+            session_.close()
+
+    # まとめたリクエストにはGapの間の既存の足も含まれるので除く
+    starts = np.array([gap.start for gap in gaps], dtype=np.int64)
+    ends = np.array([gap.end for gap in gaps], dtype=np.int64)
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    close_time = np.array([row[0] for row in data], dtype=np.int64)
+    i = np.searchsorted(starts, close_time, side="right") - 1
+    is_inside = (i >= 0) & (close_time <= ends[np.maximum(i, 0)])
+    return [row for row, inside in zip(data, is_inside) if inside]
+
+
+def repair_gaps(
+    periods: int,
+    save_path: str | Path,
+    max_workers: int = 4,
+    session: requests.Session | None = None,
+    base_url: str = BASE_URL,
+) -> int:
+    """
+    保存済みのファイルの抜けている足だけを取得して挿入する.
+    最初のGapより前の部分は書き換えない.
+
+    Args:
+        periods (int): Ex. 15分足: 900, 日足: 86400
+        save_path (str): 保存場所. 拡張子が.ohlcvならOHLCVStore, それ以外はcsv.
+        max_workers (int): 同時リクエスト数の上限.
+        session (requests.Session | None): 使い回すSession.
+        base_url (str): APIのURL.
+
+    Returns:
+        int: 挿入した足の数. 取引所側にもない足は埋まらない.
+    """
+    gaps = find_gaps(read_close_time(save_path), periods)
+    if len(gaps) == 0:
+        print("There's nothing to do.")
+        return 0
+
+    data = fetch_gaps(
+        periods, gaps, max_workers=max_workers, session=session, base_url=base_url
+    )
+    if is_store_path(save_path):
+        num_inserted = OHLCVStore(save_path).insert(data)
+    else:
+        num_inserted = csv_tail.insert_rows(save_path, data)
+    print(
+        f"btf_periods{periods}: {num_inserted} of "
+        f"{sum(gap.n_bars for gap in gaps)} missing bars in {len(gaps)} gaps are filled"
+    )
+    return num_inserted
+
+
+if __name__ == "__main__":
+    periods_list = [60, 300, 900, 3600, 86400]
+    paths: dict[int, str | Path] = {
+        period: f"../input_data/btf_periods{period}.csv" for period in periods_list
+    }
+    print(gap_index(paths))
+    with make_session(pool_size=4) as session:
+        for period, path in paths.items():
+            repair_gaps(period, path, session=session)
@@ -0,0 +1,104 @@
+import math
+from abc import ABCMeta, abstractmethod
+from collections import deque
+
+from library.simulator import Tick
+
+
+class AbstractIndicator(metaclass=ABCMeta):
+    """
+    1本ずつ値を受け取り, O(1)で更新されるテクニカル指標.
+    値が揃うまではvalueはNaNになる.
+    """
+
+    def __init__(self, length: int, source: str = "close") -> None:
+        if length <= 0:
+            raise ValueError("length must be a positive number.")
+        self.length = length
+        self.source = source  # Tickのどの列を使うか
+        self.value: float = math.nan
+        self.prev_value: float = math.nan  # 1本前のvalue (クロス判定用)
+
+    def update(self, tick: Tick) -> None:
+        self.update_value(getattr(tick, self.source))
+
+    def update_value(self, x: float) -> None:
+        self.prev_value = self.value
+        self.value = self._next(x)
+
+    @property
+    def is_ready(self) -> bool:
+        return not math.isnan(self.value)
+
+    @abstractmethod
+    def _next(self, x: float) -> float:
+        pass
+
+
+class SMA(AbstractIndicator):
+    def __init__(self, length: int, source: str = "close") -> None:
+        super().__init__(length=length, source=source)
+        self._window: deque[float] = deque()
+        # 丸め誤差が溜まらないようにKahan summationで合計を持つ
+        self._sum = 0.0
+        self._comp = 0.0
+
+    def _add(self, x: float) -> None:
+        y = x - self._comp
+        t = self._sum + y
+        self._comp = (t - self._sum) - y
+        self._sum = t
+
+    def _next(self, x: float) -> float:
+        self._window.append(x)
+        self._add(x)
+        if len(self._window) > self.length:
+            self._add(-self._window.popleft())
+        if len(self._window) < self.length:
+            return math.nan
+        return self._sum / self.length
+
+
+class ROC(AbstractIndicator):
+    """pandas_ta.rocと同じく, length本前からの変化率(%)"""
+
+    def __init__(self, length: int, source: str = "close") -> None:
+        super().__init__(length=length, source=source)
+        self._window: deque[float] = deque(maxlen=length + 1)
+
+    def _next(self, x: float) -> float:
+        self._window.append(x)
+        if len(self._window) <= self.length:
+            return math.nan
+        old = self._window[0]
+        return 100 * (x - old) / old
+
+
+class Stdev(AbstractIndicator):
+    """pandas_ta.stdevと同じく, 不偏分散(ddof=1)の平方根"""
+
+    def __init__(self, length: int, source: str = "close", ddof: int = 1) -> None:
+        super().__init__(length=length, source=source)
+        if length <= ddof:
+            raise ValueError("length must be greater than ddof.")
+        self.ddof = ddof
+        self._window: deque[float] = deque()
+        # Welford法で平均と偏差平方和を持つ
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def _next(self, x: float) -> float:
+        self._window.append(x)
+        n = len(self._window)
+        if n > self.length:
+            old = self._window.popleft()
+            mean = self._mean + (x - old) / self.length
+            self._m2 += (x - old) * (x - mean + old - self._mean)
+            self._mean = mean
+        else:
+            delta = x - self._mean
+            self._mean += delta / n
+            self._m2 += delta * (x - self._mean)
+        if n < self.length:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self.length - self.ddof))
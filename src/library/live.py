@@ -0,0 +1,267 @@
+"""
+確定した足をasyncioのフィードから受け取り, バックテストと同じRunner・戦略・約定処理で
+ペーパートレードする.
+
+    trader = LivePaperTrader(GoldenCrossStrategy(empty_ohlcv_frame()), config)
+    asyncio.run(trader.run(StreamBarFeed("127.0.0.1", port)))
+
+指標はon_tickで1本ずつ更新し, 増えていくDataFrameから計算し直すことはしない.
+"""
+
+import asyncio
+import json
+from abc import ABCMeta, abstractmethod
+from contextlib import aclosing
+from typing import Any, AsyncGenerator
+
+import pandas as pd
+
+from library.profiling import Profiler
+from library.runner import Runner
+from library.simulator import BackTester, Tick
+from library.strategy import AbstractStrategy
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+BITFLYER_WS_URL = "wss://ws.lightstream.bitflyer.com/json-rpc"
+
+
+def empty_ohlcv_frame() -> pd.DataFrame:
+    """
+    BackTesterや戦略に渡す, 足が1本もないDataFrame
+    """
+    return pd.DataFrame(
+        columns=OHLCV_COLUMNS,
+        index=pd.DatetimeIndex([], name="timestamp"),
+        dtype="float64",
+    )
+
+
+def parse_bar(message: dict[str, Any]) -> Tick:
+    """
+    {"CloseTime": UNIXtime[s], "OpenPrice": ..., "Volume": ...}(csvと同じ列名)をTickにする
+    """
+    return Tick(
+        pd.Timestamp(message["CloseTime"], unit="s"),
+        message["OpenPrice"],
+        message["HighPrice"],
+        message["LowPrice"],
+        message["ClosePrice"],
+        message["Volume"],
+    )
+
+
+def format_bar(tick: Tick) -> dict[str, Any]:
+    """
+    parse_barの逆
+    """
+    return {
+        "CloseTime": int(tick.Index.timestamp()),
+        "OpenPrice": tick.open,
+        "HighPrice": tick.high,
+        "LowPrice": tick.low,
+        "ClosePrice": tick.close,
+        "Volume": tick.volume,
+    }
+
+
+class AbstractBarFeed(metaclass=ABCMeta):
+    """
+    確定した足を古い順に1本ずつ届けるフィード
+    """
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncGenerator[Tick, None]:
+        pass
+
+
+class StreamBarFeed(AbstractBarFeed):
+    """
+    TCPで改行区切りのjson(1行が1本の足, parse_barの形式)を受け取る. Ex. ReplayServer.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+
+    async def __aiter__(self) -> AsyncGenerator[Tick, None]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while line := await reader.readline():
+                yield parse_bar(json.loads(line))
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+
+class BarAggregator:
+    """
+    約定からperiods秒足を作る. APIやresamplerと同じく, 足は(CloseTime - periods, CloseTime]の
+    約定からなり, 次の足の約定が来た時に確定する. 約定のなかった足は作らない.
+    確定済みの足に属する約定が遅れて届いた場合は捨てる.
+    """
+
+    def __init__(self, periods: int) -> None:
+        self.periods = periods
+        self.close_time: int | None = None
+        self.open = self.high = self.low = self.close = 0.0
+        self.volume = 0.0
+        self.num_late = 0  # 捨てた遅延約定の数
+
+    def add(self, timestamp: float, price: float, size: float) -> Tick | None:
+        """
+        約定を1つ加え, それで確定した足があれば返す.
+
+        Args:
+            timestamp (float): 約定時刻. UNIXtime[s].
+            price (float): 約定価格.
+            size (float): 約定数量.
+        """
+        # ちょうどCloseTimeの約定もその足に含める(resampler.bucket_close_timeと同じ)
+        close_time = int(-(-timestamp // self.periods)) * self.periods
+        if self.close_time is not None and close_time < self.close_time:
+            # 確定済みの足の約定が遅れて届いた. 足は作り直さないので捨てる
+            self.num_late += 1
+            return None
+        if close_time == self.close_time:
+            self.high = max(self.high, price)
+            self.low = min(self.low, price)
+            self.close = price
+            self.volume += size
+            return None
+
+        finished = self.flush()
+        self.close_time = close_time
+        self.open = self.high = self.low = self.close = price
+        self.volume = size
+        return finished
+
+    def flush(self) -> Tick | None:
+        """
+        作りかけの足を確定させて返す
+        """
+        if self.close_time is None:
+            return None
+        tick = Tick(
+            pd.Timestamp(self.close_time, unit="s"),
+            self.open,
+            self.high,
+            self.low,
+            self.close,
+            self.volume,
+        )
+        self.close_time = None
+        return tick
+
+
+class BitflyerBarFeed(AbstractBarFeed):
+    """
+    bitFlyer Lightningの約定(Realtime API)をpybottersで購読し, periods秒足にして届ける
+    """
+
+    def __init__(
+        self, periods: int, product_code: str = "BTC_JPY", url: str = BITFLYER_WS_URL
+    ) -> None:
+        self.periods = periods
+        self.channel = f"lightning_executions_{product_code}"
+        self.url = url
+
+    async def __aiter__(self) -> AsyncGenerator[Tick, None]:
+        # バックテストだけなら不要なので, 使う時にだけimportする
+        import pybotters
+
+        aggregator = BarAggregator(self.periods)
+        queue: asyncio.Queue[Tick] = asyncio.Queue()
+
+        def handle(message: dict[str, Any], ws: Any) -> None:
+            params = message.get("params", {})
+            if params.get("channel") != self.channel:
+                return
+            for execution in params["message"]:
+                tick = aggregator.add(
+                    pd.Timestamp(execution["exec_date"]).timestamp(),
+                    execution["price"],
+                    execution["size"],
+                )
+                if tick is not None:
+                    queue.put_nowait(tick)
+
+        async with pybotters.Client() as client:
+            await client.ws_connect(
+                self.url,
+                send_json={
+                    "method": "subscribe",
+                    "params": {"channel": self.channel},
+                    "id": 1,
+                },
+                hdlr_json=handle,
+            )
+            while True:
+                yield await queue.get()
+
+
+class LivePaperTrader:
+    """
+    フィードから届いた足ごとにBackTester.stepとRunner.stepを呼ぶ.
+    約定・有効期限・シグナルの扱いはバックテストと全く同じ.
+    1本ごとの判断にかかった時間(足を受け取ってから発注まで)をlatencyに記録する.
+    """
+
+    def __init__(
+        self,
+        strategy: AbstractStrategy,
+        config: dict[str, Any],
+        history: pd.DataFrame | None = None,
+    ) -> None:
+        """
+        Args:
+            strategy (AbstractStrategy): 戦略. 毎バーget_signalが呼ばれる.
+            config (dict): BackTesterと同じ.
+            history (pd.DataFrame | None): 指標を温めておくための過去の足.
+        """
+        self.strategy = strategy
+        self.tester = BackTester(empty_ohlcv_frame(), config)
+        self.runner = Runner(self.tester, strategy, precompute=False)
+        self.latency = Profiler()
+        if history is not None:
+            self.warmup(history)
+
+    def warmup(self, df: pd.DataFrame) -> None:
+        """
+        過去の足で戦略の指標だけを更新する. 注文は出さない.
+        """
+        for tick in df[OHLCV_COLUMNS].itertuples(name="Tick"):
+            self.strategy.on_tick(tick)
+
+    def on_bar(self, tick: Tick) -> bool:
+        """
+        1本分処理する. 既に処理した時刻以前の足は捨ててFalseを返す.
+        """
+        if tick.Index <= self.tester.now_time:
+            self.latency.count("stale_bars")
+            return False
+        t0 = self.latency.clock()
+        if self.latency.started_ns is None:
+            self.latency.started_ns = t0
+        now_time = self.tester.step(tick)
+        self.runner.step(self.tester.cursor - 1, now_time)
+        t1 = self.latency.clock()
+        self.latency.record("decision", t1 - t0)
+        self.latency.count("bars")
+        self.latency.stopped_ns = t1
+        return True
+
+    async def run(self, feed: AbstractBarFeed, max_bars: int | None = None) -> int:
+        """
+        フィードが終わるか, max_bars本処理するまで続ける.
+
+        Returns:
+            int: 処理した足の本数.
+        """
+        num_bars = 0
+        async with aclosing(feed.__aiter__()) as ticks:
+            async for tick in ticks:
+                if self.on_bar(tick):
+                    num_bars += 1
+                if max_bars is not None and num_bars >= max_bars:
+                    break
+        return num_bars
@@ -0,0 +1,251 @@
+"""
+btf_periods*.csv(や.ohlcv)をBackTesterや戦略が使う形のDataFrameとして読み込む.
+
+    df = read_ohlcv("../input_data/btf_periods900.csv", start="2023-01-01")
+
+indexは"timestamp"(足の終了時刻), columnsはopen, high, low, close, volume.
+一度読んだファイルはプロセス内でキャッシュし, 同じセッションの繰り返しのバックテストや
+スイープで読み直さない.
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from library.storage import (
+    COLUMNS,
+    OHLCVStore,
+    drop_non_numeric,
+    is_store_path,
+    to_frame,
+)
+
+RENAME_DICT = {
+    "CloseTime": "timestamp",
+    "OpenPrice": "open",
+    "HighPrice": "high",
+    "LowPrice": "low",
+    "ClosePrice": "close",
+    "Volume": "volume",
+    "QuoteVolume": "quote_volume",
+}
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+CHUNK_SIZE = 100_000  # iter_ohlcvの1回あたりの行数
+CACHE_MAX_BYTES = 1 << 30  # キャッシュの合計の上限. 超えたら古く使われたものから捨てる
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    n_entries: int
+    n_bytes: int
+    max_bytes: int
+
+
+# (絶対パス, 更新時刻, サイズ) -> (全期間・全列のDataFrame, そのメモリ使用量[byte])
+_cache: OrderedDict[tuple[str, int, int], tuple[pd.DataFrame, int]] = OrderedDict()
+_cache_bytes = 0
+_cache_max_bytes = CACHE_MAX_BYTES
+_hits = 0
+_misses = 0
+_lock = threading.Lock()
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    値が変わらない範囲で小さい型にする. 整数の価格はint32, float32で表せる列はfloat32,
+    それ以外はfloat64のまま.
+    """
+    dtypes: dict[str, Any] = {}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if len(values) == 0 or values.dtype.kind not in "iuf":
+            continue
+        if np.all(np.mod(values, 1) == 0):
+            if INT32_MIN <= values.min() and values.max() <= INT32_MAX:
+                dtypes[column] = np.int32
+        elif np.array_equal(values.astype(np.float32), values):
+            dtypes[column] = np.float32
+    return df.astype(dtypes) if dtypes else df
+
+
+def _to_ohlcv_frame(df: pd.DataFrame, compact: bool) -> pd.DataFrame:
+    """
+    csvと同じ列のDataFrameを, indexがtimestampの形にする.
+    """
+    df = df.drop_duplicates("CloseTime", keep="last").sort_values("CloseTime")
+    close_time = df["CloseTime"].to_numpy().astype(np.int64)
+    df = df.drop(columns="CloseTime").rename(columns=RENAME_DICT)
+    if compact:
+        df = compact_dtypes(df)
+    df.index = pd.DatetimeIndex(pd.to_datetime(close_time, unit="s"), name="timestamp")
+    return df
+
+
+def _parse(path: Path) -> pd.DataFrame:
+    # キャッシュには小さい型で持ち, compact=Falseならfloat64に戻して返す
+    if is_store_path(path):
+        return _to_ohlcv_frame(to_frame(OHLCVStore(path).read()), compact=True)
+    return _to_ohlcv_frame(
+        drop_non_numeric(pd.read_csv(path, usecols=COLUMNS)), compact=True
+    )
+
+
+def _to_timestamp(value: Any) -> pd.Timestamp | None:
+    # UNIXtime[s]の数値か, pd.Timestampに変換できるもの
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer, float, np.floating)):
+        return pd.Timestamp(int(value), unit="s")
+    return pd.Timestamp(value)
+
+
+def _project(
+    df: pd.DataFrame,
+    start: Any,
+    end: Any,
+    columns: list[str] | None,
+    compact: bool,
+) -> pd.DataFrame:
+    # start <= timestamp < end の行と, columnsの列を取り出す
+    start_, end_ = _to_timestamp(start), _to_timestamp(end)
+    i = 0 if start_ is None else df.index.searchsorted(start_, side="left")
+    j = len(df) if end_ is None else df.index.searchsorted(end_, side="left")
+    df = df.iloc[i:j]
+    df = df[list(columns or OHLCV_COLUMNS)]
+    if not compact:
+        df = df.astype(np.float64)
+    return df
+
+
+def _cache_key(path: Path) -> tuple[str, int, int]:
+    stat = path.stat()
+    return (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+
+def _evict() -> None:
+    global _cache_bytes
+    while _cache_bytes > _cache_max_bytes and _cache:
+        _, (_, n_bytes) = _cache.popitem(last=False)
+        _cache_bytes -= n_bytes
+
+
+def _get_cached(path: Path) -> pd.DataFrame:
+    global _cache_bytes, _hits, _misses
+    key = _cache_key(path)
+    with _lock:
+        if key in _cache:
+            _hits += 1
+            _cache.move_to_end(key)
+            return _cache[key][0]
+        _misses += 1
+
+    df = _parse(path)
+    n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+    with _lock:
+        # 同じファイルの古い版は捨てる
+        for old_key in [k for k in _cache if k[0] == key[0] and k != key]:
+            _cache_bytes -= _cache.pop(old_key)[1]
+        if n_bytes <= _cache_max_bytes and key not in _cache:
+            _cache[key] = (df, n_bytes)
+            _cache_bytes += n_bytes
+            _evict()
+    return df
+
+
+def read_ohlcv(
+    path: str | Path,
+    start: Any = None,
+    end: Any = None,
+    columns: list[str] | None = None,
+    compact: bool = True,
+    cache: bool = True,
+) -> pd.DataFrame:
+    """
+    btf_periods*.csvや.ohlcvを, BackTesterにそのまま渡せるDataFrameとして読み込む.
+    数値でない行は読み飛ばし, CloseTimeの重複を除いて昇順に並べる.
+
+    Args:
+        path (str | Path): 拡張子が.ohlcvならOHLCVStore, それ以外はcsv.
+        start: この時刻以降の足. UNIXtime[s]かpd.Timestampに変換できるもの. Noneなら先頭から.
+        end: この時刻より前の足. Noneなら末尾まで.
+        columns (list[str] | None): 取り出す列. Noneならopen, high, low, close, volume.
+            quote_volumeも指定できる.
+        compact (bool): Trueなら値の変わらない範囲で小さい型(価格はint32など)にする.
+            Falseなら全てfloat64.
+        cache (bool): Trueならプロセス内のキャッシュを使う. ファイルが更新されれば読み直す.
+
+    Returns:
+        pd.DataFrame: indexが"timestamp". キャッシュと値を共有するので, 値を直接書き換えないこと
+            (列の追加はキャッシュに影響しない).
+    """
+    path = Path(path)
+    df = _get_cached(path) if cache else _parse(path)
+    return _project(df, start, end, columns, compact).copy(deep=False)
+
+
+def iter_ohlcv(
+    path: str | Path,
+    chunksize: int = CHUNK_SIZE,
+    start: Any = None,
+    end: Any = None,
+    columns: list[str] | None = None,
+    compact: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    ファイル全体をメモリに載せずに, chunksize行ずつ読み込む. キャッシュは使わない.
+    重複の除去と並べ替え, compactの型の選択はchunkの中だけで行う.
+
+    Args:
+        path (str | Path): 拡張子が.ohlcvならOHLCVStore, それ以外はcsv.
+        chunksize (int): 1回あたりの行数.
+        start, end, columns, compact: read_ohlcvと同じ.
+    """
+    path = Path(path)
+    if is_store_path(path):
+        store = OHLCVStore(path)
+        start_, end_ = _to_timestamp(start), _to_timestamp(end)
+        records = store.read(
+            start=None if start_ is None else int(start_.timestamp()),
+            end=None if end_ is None else int(end_.timestamp()),
+        )
+        for i in range(0, len(records), chunksize):
+            chunk = _to_ohlcv_frame(to_frame(records[i : i + chunksize]), compact)
+            yield _project(chunk, None, None, columns, compact)
+        return
+
+    for chunk in pd.read_csv(path, usecols=COLUMNS, chunksize=chunksize):
+        chunk = drop_non_numeric(chunk)
+        if len(chunk) == 0:
+            continue
+        df = _project(_to_ohlcv_frame(chunk, compact), start, end, columns, compact)
+        if len(df) > 0:
+            yield df
+
+
+def cache_info() -> CacheInfo:
+    with _lock:
+        return CacheInfo(_hits, _misses, len(_cache), _cache_bytes, _cache_max_bytes)
+
+
+def clear_cache() -> None:
+    global _cache_bytes, _hits, _misses
+    with _lock:
+        _cache.clear()
+        _cache_bytes = _hits = _misses = 0
+
+
+def set_cache_limit(max_bytes: int) -> None:
+    """
+    キャッシュの合計の上限[byte]を変える. 超えていれば古く使われたものから捨てる.
+    """
+    global _cache_max_bytes
+    with _lock:
+        _cache_max_bytes = max_bytes
+        _evict()
@@ -0,0 +1,164 @@
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from library.simulator import INITIAL_CASH
+
+
+class MonteCarloResult(NamedTuple):
+    """
+    パスごとの結果. 各配列の長さはパスの本数.
+    num_rejected: 数量が0以下で出せなかった注文の数. BackTesterでは例外になり記録されない
+        注文なので, num_executed, num_expired, num_invalidには含めない.
+    valuation: keep_paths=Trueの場合だけ (パス数, バー数) の評価額
+    """
+
+    final_valuation: np.ndarray
+    max_drawdown: np.ndarray
+    num_executed: np.ndarray
+    num_expired: np.ndarray
+    num_invalid: np.ndarray
+    num_rejected: np.ndarray
+    valuation: np.ndarray | None = None
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "final_valuation": self.final_valuation,
+                "max_drawdown": self.max_drawdown,
+                "num_executed": self.num_executed,
+                "num_expired": self.num_expired,
+                "num_invalid": self.num_invalid,
+                "num_rejected": self.num_rejected,
+            }
+        )
+
+
+def path_generators(seed: int, n_paths: int) -> list[np.random.Generator]:
+    """
+    パスごとに独立した乱数列. パスkの乱数はn_pathsやチャンクの切り方によらない.
+    """
+    return [
+        np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_paths)
+    ]
+
+
+def run_random_policy(
+    ohlcv_df: pd.DataFrame,
+    config: dict[str, Any],
+    n_paths: int,
+    seed: int = 0,
+    chunk_size: int = 1000,
+    block_size: int = 4096,
+    keep_paths: bool = False,
+) -> MonteCarloResult:
+    """
+    myRunnerと同じランダムな売買(偶数本目に保有cashのランダムな割合で買い, 奇数本目に
+    保有ポジションのランダムな割合で売る)を, n_paths本まとめてシミュレーションする.
+    状態は (パス数,) の配列で持ち, バーの方向だけループする.
+
+    注文は常に1つで次のバーで処理されるので, BackTester.handle_ordersと同じく
+    有効期限切れ -> validate_orderと同じcash/positionのチェック -> 成行で約定, の順に判定する.
+    数量が0以下の注文(ポジションがない時の売りなど)はBackTesterではMarketOrderが
+    受け付けず記録もされないので, 約定・期限切れ・無効のどれにも数えず,
+    num_rejectedに別に数える.
+
+    Args:
+        ohlcv_df (pd.DataFrame): indexが"timestamp", "close"列を持つデータ.
+        config (dict): BackTesterと同じ. "slippage", "minutes_to_expire", "initial_cash"を使う.
+        n_paths (int): パスの本数.
+        seed (int): 乱数のシード.
+        chunk_size (int): 同時に計算するパスの本数.
+        block_size (int): 乱数をまとめて生成するバーの本数.
+        keep_paths (bool): Trueなら全パスの評価額の推移も返す.
+    """
+    close = ohlcv_df["close"].to_numpy(np.float64)
+    n_bars = len(close)
+    if n_bars == 0:
+        raise ValueError("ohlcv_df is empty.")
+    times = ohlcv_df.index.values.astype("datetime64[s]").astype(np.int64)
+    slippage: float = config["slippage"]
+    # i本目で出した注文がi + 1本目で期限切れになるか
+    is_expired = np.diff(times) >= config["minutes_to_expire"] * 60
+    buy_price = np.round(close * (1 + slippage))
+    sell_price = np.round(close * (1 - slippage))
+    initial_cash = config.get("initial_cash", INITIAL_CASH)
+
+    generators = path_generators(seed, n_paths)
+    final_valuation = np.empty(n_paths)
+    max_drawdown = np.empty(n_paths)
+    num_executed = np.zeros(n_paths, dtype=np.int64)
+    num_expired = np.zeros(n_paths, dtype=np.int64)
+    num_invalid = np.zeros(n_paths, dtype=np.int64)
+    num_rejected = np.zeros(n_paths, dtype=np.int64)
+    valuation_paths = np.empty((n_paths, n_bars)) if keep_paths else None
+
+    for chunk_start in range(0, n_paths, chunk_size):
+        chunk = slice(chunk_start, min(chunk_start + chunk_size, n_paths))
+        chunk_generators = generators[chunk]
+        m = len(chunk_generators)
+        cash: np.ndarray = np.full(m, float(initial_cash))
+        position: np.ndarray = np.zeros(m)
+        size: np.ndarray = np.zeros(m)  # 未処理の注文の数量
+        peak = np.full(m, -np.inf)
+        drawdown = np.zeros(m)
+        # viewなので, 加算するとnum_*に反映される
+        executed = num_executed[chunk]
+        expired = num_expired[chunk]
+        invalid = num_invalid[chunk]
+        rejected = num_rejected[chunk]
+
+        for block_start in range(0, n_bars, block_size):
+            block_end = min(block_start + block_size, n_bars)
+            portions = np.stack(
+                [g.random(block_end - block_start) for g in chunk_generators]
+            )
+            for i in range(block_start, block_end):
+                # i - 1本目で出した注文の処理
+                if i > 0:
+                    # 数量が0以下の注文は出ていないものとして扱う
+                    is_positive = size > 0
+                    rejected += ~is_positive
+                    if is_expired[i - 1]:
+                        expired += is_positive
+                    elif (i - 1) % 2 == 0:
+                        is_valid = is_positive & (cash - buy_price[i] * size >= 0)
+                        cash = np.where(
+                            is_valid, cash + buy_price[i] * size * (-1), cash
+                        )
+                        position = np.where(is_valid, position + size, position)
+                        executed += is_valid
+                        invalid += is_positive & ~is_valid
+                    else:
+                        is_valid = is_positive & (position - size >= 0)
+                        cash = np.where(is_valid, cash + sell_price[i] * size, cash)
+                        position = np.where(is_valid, position + size * (-1), position)
+                        executed += is_valid
+                        invalid += is_positive & ~is_valid
+
+                valuation = position * close[i] + cash
+                peak = np.maximum(peak, valuation)
+                drawdown = np.maximum(drawdown, (peak - valuation) / peak)
+                if valuation_paths is not None:
+                    valuation_paths[chunk, i] = valuation
+
+                # i本目の発注
+                portion = portions[:, i - block_start]
+                if i % 2 == 0:
+                    size = cash / close[i] * portion
+                else:
+                    size = position * portion
+
+        final_valuation[chunk] = valuation
+        max_drawdown[chunk] = drawdown
+
+    return MonteCarloResult(
+        final_valuation=final_valuation,
+        max_drawdown=max_drawdown,
+        num_executed=num_executed,
+        num_expired=num_expired,
+        num_invalid=num_invalid,
+        num_rejected=num_rejected,
+        valuation=valuation_paths,
+    )
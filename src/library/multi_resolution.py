@@ -0,0 +1,59 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from library.simulator import BackTester, Tick
+
+TICK_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+class MultiResolutionBackTester(BackTester):
+    """
+    シグナルは粗い足(Ex. 900秒足)で出し, 約定・指値の判定・有効期限は細かい足(Ex. 60秒足)で行う.
+    BackTesterとしてはシグナル足で進み, snapshotやsubscribeのコールバックもシグナル足ごと.
+    シグナル足で出した注文は, その足より後の約定足から処理される.
+    """
+
+    def __init__(
+        self,
+        signal_df: pd.DataFrame,
+        execution_df: pd.DataFrame,
+        config: dict[str, Any],
+    ) -> None:
+        """
+        Args:
+            signal_df (pd.DataFrame): 戦略が見るデータ. indexが"timestamp"(足の終了時刻).
+            execution_df (pd.DataFrame): 約定に使う細かい足. columnsはsignal_dfと同じ.
+            config (dict): BackTesterと同じ.
+        """
+        super().__init__(signal_df, config)
+        self.execution_df = execution_df
+        self._execution_index = pd.DatetimeIndex(execution_df.index)
+        self._execution_values = execution_df[TICK_COLUMNS].to_numpy(np.float64)
+
+        # i本目のシグナル足には, 約定足の[bounds[i - 1], bounds[i])が含まれる
+        signal_ns = signal_df.index.values.astype("datetime64[ns]")
+        execution_ns = self._execution_index.values.astype("datetime64[ns]")
+        self.execution_bounds = np.searchsorted(execution_ns, signal_ns, side="right")
+
+    def execution_tick(self, j: int) -> Tick:
+        return Tick(self._execution_index[j], *self._execution_values[j].tolist())
+
+    def handle_orders(self) -> None:
+        if not self.order_book:
+            return
+        i = self.cursor - 1  # 現在のシグナル足の番号
+        start = self.execution_bounds[i - 1] if i > 0 else self.execution_bounds[0]
+        end = self.execution_bounds[i]
+
+        signal_tick = self.tick
+        for j in range(start, end):
+            # 注文はシグナル足の処理後にしか増えないので, 板が空になれば残りの約定足は見なくてよい
+            if not self.order_book:
+                break
+            self.tick = self.execution_tick(j)
+            self.now_time = self.tick.Index
+            super().handle_orders()
+        self.tick = signal_tick
+        self.now_time = signal_tick.Index
@@ -0,0 +1,93 @@
+from typing import Any
+
+import pandas as pd
+
+from library.runner import Runner
+from library.simulator import INITIAL_CASH, BackTester
+from library.strategy import AbstractStrategy
+
+
+class PortfolioRunner:
+    """
+    複数の戦略を, 1つのバーのカーソルで同時にバックテストする.
+    戦略ごとに独立したBackTester(cash, position, 注文)を持ち, 各バーのデータは1回だけ読む.
+    weightsを指定すると, INITIAL_CASHをその比率で各戦略に配分し, 合算した口座も見られる.
+    """
+
+    def __init__(
+        self,
+        ohlcv_df: pd.DataFrame,
+        strategies: dict[str, AbstractStrategy],
+        config: dict[str, Any],
+        weights: dict[str, float] | None = None,
+    ) -> None:
+        """
+        Args:
+            ohlcv_df (pd.DataFrame): indexが"timestamp", columnsが"open", "high", "low",
+                "close", "volume"のデータ.
+            strategies (dict[str, AbstractStrategy]): 戦略の名前と戦略.
+            config (dict): 全ての戦略で共通のBackTesterのconfig.
+            weights (dict[str, float] | None): 戦略ごとの資金の配分. 合計が1になるよう正規化する.
+                Noneなら各戦略がINITIAL_CASHを持つ(個別に回すのと同じ).
+        """
+        self.ohlcv_df = ohlcv_df
+        self.weights: dict[str, float] | None = None
+        if weights is not None:
+            if set(weights) != set(strategies):
+                raise ValueError("weights must have the same keys as strategies.")
+            total = sum(weights.values())
+            self.weights = {name: w / total for name, w in weights.items()}
+
+        self.runners: dict[str, Runner] = {}
+        for name, strategy in strategies.items():
+            book_config = dict(config)
+            if self.weights is not None:
+                book_config["initial_cash"] = INITIAL_CASH * self.weights[name]
+            tester = BackTester(ohlcv_df, book_config)
+            self.runners[name] = Runner(tester=tester, strategy=strategy)
+
+    @property
+    def testers(self) -> dict[str, BackTester]:
+        return {name: runner.tester for name, runner in self.runners.items()}
+
+    def run(self) -> None:
+        runners = list(self.runners.values())
+        for i, tick in enumerate(self.ohlcv_df.itertuples(name="Tick")):
+            for runner in runners:
+                now_time = runner.tester.step(tick)
+                runner.step(i, now_time)
+
+    @property
+    def snapshots(self) -> dict[str, pd.DataFrame]:
+        return {name: tester.snapshots for name, tester in self.testers.items()}
+
+    @property
+    def combined_snapshots(self) -> pd.DataFrame:
+        """
+        配分した資金で回した全戦略を1つの口座とみなしたcash, position, valuation
+        """
+        if self.weights is None:
+            raise ValueError("combined_snapshots requires weights.")
+        snapshots = list(self.snapshots.values())
+        combined = snapshots[0].copy()
+        for snapshot in snapshots[1:]:
+            combined += snapshot
+        return combined
+
+    def summary(self) -> pd.DataFrame:
+        """
+        戦略ごとの最終評価額と注文の結果の件数
+        """
+        rows = []
+        for name, tester in self.testers.items():
+            registry = tester.order_registry
+            rows.append(
+                {
+                    "strategy": name,
+                    "final_valuation": tester.snapshots["valuation"].iloc[-1],
+                    "num_executed": registry.count("executed"),
+                    "num_expired": registry.count("expired"),
+                    "num_invalid": registry.count("invalid"),
+                }
+            )
+        return pd.DataFrame(rows).set_index("strategy")
@@ -0,0 +1,113 @@
+import json
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+class Profiler:
+    """
+    シミュレーションのループの段階ごとの所要時間とカウンタを記録する.
+    BackTester(config["profile"]=True)とRunnerが毎バー記録する.
+    時間はtime.perf_counter_nsで測り, 1回ごとの値を持つのでパーセンタイルも出せる.
+    """
+
+    def __init__(self) -> None:
+        self._timings: defaultdict[str, list[int]] = defaultdict(list)
+        self.counters: Counter[str] = Counter()
+        self.started_ns: int | None = None  # 最初のバーの開始時刻
+        self.stopped_ns: int | None = None  # 最後のバーの終了時刻
+
+    @staticmethod
+    def clock() -> int:
+        return time.perf_counter_ns()
+
+    def record(self, stage: str, elapsed_ns: int) -> None:
+        self._timings[stage].append(elapsed_ns)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def timings(self, stage: str) -> np.ndarray:
+        """
+        stageの1回ごとの所要時間[ns]
+        """
+        return np.asarray(self._timings.get(stage, []), dtype=np.int64)
+
+    @property
+    def elapsed(self) -> float:
+        """
+        最初のバーから最後のバーまでの経過時間[s]
+        """
+        if self.started_ns is None or self.stopped_ns is None:
+            return 0.0
+        return (self.stopped_ns - self.started_ns) / 1e9
+
+    @property
+    def bars_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.counters["bars"] / elapsed if elapsed > 0 else float("nan")
+
+    def summary(self) -> pd.DataFrame:
+        """
+        段階ごとの呼び出し回数, 合計時間, 1回あたりの時間のパーセンタイル[us]
+        """
+        rows = []
+        for stage in self._timings:
+            ns = self.timings(stage)
+            p50, p90, p99 = np.percentile(ns, [50, 90, 99]) / 1e3
+            rows.append(
+                {
+                    "stage": stage,
+                    "calls": len(ns),
+                    "total_s": ns.sum() / 1e9,
+                    "mean_us": ns.mean() / 1e3,
+                    "p50_us": p50,
+                    "p90_us": p90,
+                    "p99_us": p99,
+                    "max_us": ns.max() / 1e3,
+                }
+            )
+        summary = pd.DataFrame(
+            rows,
+            columns=[
+                "stage",
+                "calls",
+                "total_s",
+                "mean_us",
+                "p50_us",
+                "p90_us",
+                "p99_us",
+                "max_us",
+            ],
+        ).set_index("stage")
+        elapsed = self.elapsed
+        summary["share"] = summary["total_s"] / elapsed if elapsed > 0 else np.nan
+        return summary
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "elapsed_s": self.elapsed,
+            "bars_per_sec": self.bars_per_sec,
+            "counters": dict(self.counters),
+            "stages": self.summary().to_dict(orient="index"),
+        }
+
+    def export(self, path: str | Path) -> None:
+        """
+        to_dictをjsonで書き出す
+        """
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def report(self) -> str:
+        lines = [
+            f"bars: {self.counters['bars']}, elapsed: {self.elapsed:.3f}s, "
+            f"bars/sec: {self.bars_per_sec:,.0f}",
+            "counters: "
+            + ", ".join(f"{name}={n}" for name, n in sorted(self.counters.items())),
+            self.summary().to_string(float_format=lambda x: f"{x:.3f}"),
+        ]
+        return "\n".join(lines)
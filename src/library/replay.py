@@ -0,0 +1,77 @@
+"""
+保存済みの足(Ex. btf_periods60.csv)を, ライブで確定したかのように配信するローカルのサーバー.
+LivePaperTraderをStreamBarFeedで動かして確かめるために使う.
+
+    async with ReplayServer(read_ohlcv("../input_data/btf_periods60.csv")) as server:
+        await trader.run(StreamBarFeed(server.host, server.port))
+"""
+
+import asyncio
+import json
+
+import pandas as pd
+
+from library.live import OHLCV_COLUMNS, format_bar
+
+
+class ReplayServer:
+    """
+    接続ごとに先頭から, 1行1本の改行区切りのjson(live.parse_barの形式)で配信し,
+    最後まで送ったら接続を閉じる.
+    """
+
+    def __init__(
+        self,
+        ohlcv_df: pd.DataFrame,
+        interval: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Args:
+            ohlcv_df (pd.DataFrame): indexが"timestamp"(足の終了時刻).
+            interval (float): 足を送る間隔[s]. 0なら待たずに送る.
+            host (str): 待ち受けるアドレス.
+            port (int): 待ち受けるポート. 0なら空いているポートを使う.
+        """
+        # 毎回変換しないよう, 送る行を先に作っておく
+        self.lines = [
+            (json.dumps(format_bar(tick)) + "\n").encode()
+            for tick in ohlcv_df[OHLCV_COLUMNS].itertuples(name="Tick")
+        ]
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __aenter__(self) -> "ReplayServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        await self.close()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            for line in self.lines:
+                writer.write(line)
+                await writer.drain()
+                if self.interval > 0:
+                    await asyncio.sleep(self.interval)
+        except ConnectionError:
+            # クライアントが途中で切断した
+            pass
+        finally:
+            writer.close()
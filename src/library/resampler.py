@@ -0,0 +1,133 @@
+import datetime as dt
+import io
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from library import csv_tail
+from library.storage import (
+    COLUMNS,
+    OHLCV_DTYPE,
+    OHLCVStore,
+    drop_non_numeric,
+    is_store_path,
+    to_frame,
+    to_records,
+)
+
+SOURCE_PERIODS = 60  # 1分足から他の足を作る
+
+
+def bucket_close_time(close_time: np.ndarray, periods: int) -> np.ndarray:
+    """
+    cryptowatchと同じく, CloseTimeがTの足は (T - periods, T] の区間を表す.
+    各1分足が属する足のCloseTime(periodsの倍数に切り上げ)を返す.
+    """
+    return -(-close_time // periods) * periods
+
+
+def resample(records: np.ndarray, periods: int) -> np.ndarray:
+    """
+    CloseTime昇順のOHLCV(OHLCV_DTYPE)をperiods秒足にまとめる.
+    データが1本もない区間の足は作らない.
+    """
+    if len(records) == 0:
+        return np.empty(0, dtype=OHLCV_DTYPE)
+    buckets = bucket_close_time(records["CloseTime"], periods)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(records)] - 1
+
+    resampled = np.empty(len(starts), dtype=OHLCV_DTYPE)
+    resampled["CloseTime"] = buckets[starts]
+    resampled["OpenPrice"] = records["OpenPrice"][starts]
+    resampled["HighPrice"] = np.maximum.reduceat(records["HighPrice"], starts)
+    resampled["LowPrice"] = np.minimum.reduceat(records["LowPrice"], starts)
+    resampled["ClosePrice"] = records["ClosePrice"][ends]
+    resampled["Volume"] = np.add.reduceat(records["Volume"], starts)
+    resampled["QuoteVolume"] = np.add.reduceat(records["QuoteVolume"], starts)
+    return resampled
+
+
+def resample_new_bars(
+    source: np.ndarray, periods: int, last_close_time: int | None
+) -> np.ndarray:
+    """
+    last_close_timeより後の, 確定した足だけを作る.
+    1分足のCloseTimeがTに達していない足(作りかけ)は次回に回す.
+
+    Args:
+        source (np.ndarray): 1分足. CloseTime昇順.
+        periods (int): 作る足. Ex. 15分足: 900, 日足: 86400
+        last_close_time (int | None): 既に保存されている最後の足のCloseTime.
+    """
+    if last_close_time is not None:
+        # last_close_timeより後の足に入る1分足だけを使う
+        i = np.searchsorted(source["CloseTime"], last_close_time, side="right")
+        source = source[i:]
+    if len(source) == 0:
+        return np.empty(0, dtype=OHLCV_DTYPE)
+    resampled = resample(source, periods)
+    is_closed = resampled["CloseTime"] <= source["CloseTime"][-1]
+    return resampled[is_closed]
+
+
+def read_csv_after(path: str | Path, close_time: int | None) -> np.ndarray:
+    """
+    csvのうちCloseTimeがclose_timeより後の行だけを読む. 数値でない行は読み飛ばし,
+    CloseTimeの重複を除いて昇順に並べる.
+
+    Args:
+        path (str | Path): btf_periods*.csv.
+        close_time (int | None): Noneならファイル全体.
+    """
+    offset = 0 if close_time is None else csv_tail.offset_after(path, close_time)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    if len(data.strip()) == 0:
+        return np.empty(0, dtype=OHLCV_DTYPE)
+    # 先頭から読む場合のヘッダー行は数値でない行として除かれる
+    df = pd.read_csv(io.BytesIO(data), names=COLUMNS, header=None, dtype=str)
+    df = drop_non_numeric(df)
+    df = df.drop_duplicates("CloseTime", keep="last").sort_values("CloseTime")
+    return to_records(df)
+
+
+def add_resampled_data(
+    periods: int, source_path: str | Path, save_path: str | Path
+) -> None:
+    """1分足のファイルから, periods秒足のファイルに新しい足を追加する.
+    APIから取得する代わりに使う. 拡張子が.ohlcvならOHLCVStore, それ以外はcsvとして扱う.
+
+    Args:
+        periods (int): Ex. 15分足: 900, 日足: 86400
+        source_path (str): 1分足の保存場所.
+        save_path (str): periods秒足の保存場所.
+
+    """
+    if is_store_path(save_path):
+        store = OHLCVStore(save_path)
+        last_close_time = store.last_close_time()
+    else:
+        last_close_time = csv_tail.last_close_time(save_path)
+
+    if is_store_path(source_path):
+        source = OHLCVStore(source_path).read(start=last_close_time)
+    else:
+        source = read_csv_after(source_path, last_close_time)
+    new_bars = resample_new_bars(source, periods, last_close_time)
+    if len(new_bars) == 0:
+        print("There's nothing to do.")
+        return None
+
+    print(
+        f"Data from {dt.datetime.fromtimestamp(int(new_bars['CloseTime'][0]))} to "
+        f"{dt.datetime.fromtimestamp(int(new_bars['CloseTime'][-1]))} are saved"
+    )
+    if is_store_path(save_path):
+        store.append(new_bars)
+    else:
+        csv_tail.append_rows(
+            save_path, to_frame(new_bars).itertuples(index=False, name=None)
+        )
@@ -1,20 +1,40 @@
+import copy
+import math
+from typing import Any
+
 import pandas as pd
 
-from library.simulator import BackTester, MarketOrder, Order
-from library.strategy import AbstractStrategy
+from library.profiling import Profiler
+from library.simulator import BackTester, LimitOrder, MarketOrder, Order, Tick
+from library.strategy import AbstractStrategy, Signal
 
 THRESHOLD: float = 10000
 # 10000円以下のポジションは無視する
 
 
 class Runner:
-    def __init__(self, tester: BackTester, strategy: AbstractStrategy) -> None:
+    def __init__(
+        self, tester: BackTester, strategy: AbstractStrategy, precompute: bool = True
+    ) -> None:
+        """
+        Args:
+            tester (BackTester): 約定処理を行うBackTester.
+            strategy (AbstractStrategy): 戦略.
+            precompute (bool): Trueならcompute_signalsでシグナルを一括計算する.
+                Falseなら毎バーon_tickで指標を更新してget_signalを呼ぶ
+                (ライブのように足が後から届く場合).
+        """
         self.tester = tester
         self.strategy = strategy
+        # シグナルを一括計算できる戦略なら, 毎バーのget_signal呼び出しを省く
+        self.signals = strategy.compute_signals(tester.ohlcv_df) if precompute else None
+        if self.signals is None:
+            self.tester.subscribe(self.strategy.on_tick)
         self.unexecuted_order: Order | None = None  # 発注済みだが未約定の注文
         self.current_position: float = 0
         # abs(current_position) *（現在価格）< THRESHOLDの場合にはポジションが存在しないとみなす
         self.exit_time: pd.Timestamp | None = None
+        self.profiler = tester.profiler
 
     @property
     def has_position(
@@ -23,41 +43,148 @@ class Runner:
         return abs(self.current_position) * self.tester.tick.close >= THRESHOLD
 
     def run(self) -> None:
-        for now_time in self.tester:
-            self.update_status()
-            if self.unexecuted_order:
-                continue
-            if not self.has_position:
-                # ポジション作成
-                self.exit_time = None
-                signal = self.strategy.get_signal(self.tester.get_current_state())
-                if signal:
-                    order = MarketOrder(now_time, signal.side, signal.size)
-                    self.exit_time = signal.exit_time
-                    self.tester.add_order(order)
-                    self.unexecuted_order = order
+        # チェックポイントから再開した場合は, 続きのバーから数える
+        for i, now_time in enumerate(self.tester, start=self.tester.cursor):
+            self.step(i, now_time)
+
+    def step(self, i: int, now_time: pd.Timestamp) -> None:
+        """
+        i本目のバーの処理. testerを進めた直後に呼ぶ.
+        """
+        if self.profiler is not None:
+            return self._profiled_step(i, now_time, self.profiler)
+        self.update_status()
+        self.place_order(i, now_time)
+
+    def _profiled_step(
+        self, i: int, now_time: pd.Timestamp, profiler: Profiler
+    ) -> None:
+        t0 = profiler.clock()
+        self.update_status()
+        t1 = profiler.clock()
+        num_orders = len(self.tester.order_registry)
+        self.place_order(i, now_time)
+        t2 = profiler.clock()
+        profiler.record("update_status", t1 - t0)
+        profiler.record("place_order", t2 - t1)
+        profiler.count("orders_placed", len(self.tester.order_registry) - num_orders)
+        profiler.stopped_ns = t2
+
+    def _timed_get_signal(self, i: int, profiler: Profiler) -> Signal | None:
+        t0 = profiler.clock()
+        signal = self.get_signal(i)
+        profiler.record("get_signal", profiler.clock() - t0)
+        if signal:
+            profiler.count("signals")
+        return signal
+
+    def place_order(self, i: int, now_time: pd.Timestamp) -> None:
+        """
+        ポジションがなければシグナルに従って建て, あればexit_timeを過ぎたら手仕舞う
+        """
+        if self.unexecuted_order:
+            return
+        if not self.has_position:
+            # ポジション作成
+            self.exit_time = None
+            if self.profiler is None:
+                signal = self.get_signal(i)
             else:
-                # 手仕舞い
-                if self.exit_time and self.exit_time > now_time:
-                    continue
-                order = MarketOrder(
-                    now_time,
-                    "SELL" if self.current_position > 0 else "BUY",
-                    abs(self.current_position),
-                )
+                signal = self._timed_get_signal(i, self.profiler)
+            if signal:
+                order: Order
+                if signal.price is None:
+                    order = MarketOrder(now_time, signal.side, signal.size)
+                else:
+                    order = LimitOrder(now_time, signal.side, signal.size, signal.price)
+                self.exit_time = signal.exit_time
                 self.tester.add_order(order)
                 self.unexecuted_order = order
+        else:
+            # 手仕舞い
+            if self.exit_time and self.exit_time > now_time:
+                return
+            order = MarketOrder(
+                now_time,
+                "SELL" if self.current_position > 0 else "BUY",
+                abs(self.current_position),
+            )
+            self.tester.add_order(order)
+            self.unexecuted_order = order
+
+    def get_signal(self, i: int) -> Signal | None:
+        if self.signals is None:
+            return self.strategy.get_signal(self.tester.get_current_state())
+
+        # 事前計算したi本目のシグナルを使う
+        side = int(self.signals.side[i])
+        if side == 0:
+            return None
+        size_fraction = float(self.signals.size_fraction[i])
+        exit_offset = int(self.signals.exit_offset[i])
+        exit_time = None
+        if exit_offset:
+            exit_time = self.tester.now_time + pd.Timedelta(seconds=exit_offset)
+        # ArrayBackTesterと同じく, NaNの指値は成行注文
+        price = None
+        if self.signals.limit_price is not None:
+            limit_price = float(self.signals.limit_price[i])
+            if not math.isnan(limit_price):
+                price = limit_price
+        return Signal(
+            side="BUY" if side > 0 else "SELL",
+            size=self.tester.cash * size_fraction / self.tester.tick.close,
+            exit_time=exit_time,
+            price=price,
+        )
+
+    def get_state(self) -> dict[str, Any]:
+        """
+        途中から再開するための状態. testerの状態は含まない.
+        """
+        return {
+            "unexecuted_order_id": (
+                None if self.unexecuted_order is None else self.unexecuted_order.id
+            ),
+            "current_position": self.current_position,
+            "exit_time": self.exit_time,
+            "strategy_tick": (
+                None if self.strategy.tick is None else tuple(self.strategy.tick)
+            ),
+            # 指標のdequeなどは後のバーで書き換わるので, 保存時点の値をコピーする
+            "indicators": [
+                copy.deepcopy(vars(indicator)) for indicator in self.strategy.indicators
+            ],
+        }
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """
+        get_stateの状態から再開する. 先にtester.set_stateを呼んでおく.
+        """
+        order_id = state["unexecuted_order_id"]
+        self.unexecuted_order = (
+            None if order_id is None else self.tester.order_registry.get(order_id)
+        )
+        self.current_position = state["current_position"]
+        self.exit_time = state["exit_time"]
+        tick = state["strategy_tick"]
+        self.strategy.tick = None if tick is None else Tick(*tick)
+        for indicator, indicator_state in zip(
+            self.strategy.indicators, state["indicators"]
+        ):
+            # 同じstateから何度でも再開できるよう, stateそのものは指標に渡さない
+            vars(indicator).update(copy.deepcopy(indicator_state))
 
     def update_status(self) -> None:
         if self.unexecuted_order is None:
             return
 
         if self.unexecuted_order.is_unexecuted:
-            assert self.unexecuted_order in self.tester.active_orders
+            assert self.unexecuted_order in self.tester.order_book
             return
 
         # 以下 executed or expired or invalid
-        assert self.unexecuted_order in self.tester.archived_orders
+        assert self.tester.order_registry.is_archived(self.unexecuted_order)
         if self.unexecuted_order.is_executed:
             # 約定していた場合
             self.current_position += self.unexecuted_order.result.position_diff
@@ -1,13 +1,36 @@
+import bisect
+import copy
+import heapq
+import os
 import random
-from typing import Any, Literal, NamedTuple
+from pathlib import Path
+from typing import Any, Callable, Literal, NamedTuple
 
+import numpy as np
 import pandas as pd
 
+from library.profiling import Profiler
+
 INITIAL_CASH = 1000000  # 100万円
 
 Side = Literal["BUY", "SELL"]
 
 
+class SignalArrays(NamedTuple):
+    """
+    全バー分のシグナルをまとめた配列. 各配列の長さはohlcvの行数と一致する.
+    side: 1ならBUY, -1ならSELL, 0ならシグナルなし
+    size_fraction: シグナル時点の保有cashのうち注文に使う割合
+    exit_offset: シグナル時刻から手仕舞いを始めるまでの秒数 (0ならexit_timeなしと同じ)
+    limit_price: 指値. NaNまたはNoneなら成行注文
+    """
+
+    side: np.ndarray
+    size_fraction: np.ndarray
+    exit_offset: np.ndarray
+    limit_price: np.ndarray | None = None
+
+
 class Tick(NamedTuple):
     Index: pd.Timestamp
     open: float
@@ -24,7 +47,11 @@ class OrderResult(NamedTuple):
     position_diff: float | None = None
 
 
+ORDER_STATUSES = ("unexecuted", "executed", "expired", "invalid")
+
+
 class BaseOrder:
+    __slots__ = ("id", "timestamp", "side", "size", "result")
     _id = 0
 
     def __init__(
@@ -55,10 +82,22 @@ class BaseOrder:
     def is_unexecuted(self) -> bool:
         return self.result.completion_status == "unexecuted"
 
+    def as_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in _all_slots(type(self))}
+
+
+def _all_slots(cls: type) -> list[str]:
+    slots: list[str] = []
+    for klass in reversed(cls.__mro__):
+        slots += list(getattr(klass, "__slots__", ()))
+    return slots
+
 
 class LimitOrder(BaseOrder):
+    __slots__ = ("price",)
+
     def __init__(
-        self, timestamp: pd.Timestamp, side: Side, size: float, price: int
+        self, timestamp: pd.Timestamp, side: Side, size: float, price: float
     ) -> None:
         if price < 0:
             raise ValueError("price must be a non-negative number.")
@@ -67,6 +106,8 @@ class LimitOrder(BaseOrder):
 
 
 class MarketOrder(BaseOrder):
+    __slots__ = ()
+
     def __init__(self, timestamp: pd.Timestamp, side: Side, size: float) -> None:
         super().__init__(timestamp=timestamp, side=side, size=size)
 
@@ -74,6 +115,197 @@ class MarketOrder(BaseOrder):
 Order = LimitOrder | MarketOrder
 
 
+class OrderBook:
+    """
+    未約定の注文を管理する.
+    有効期限順のヒープと, 価格順に並べた買い/売りの指値を持ち,
+    各バーで期限切れ・約定候補になる注文だけを取り出せるようにする.
+    """
+
+    def __init__(self, minutes_to_expire: int) -> None:
+        self.expire_ns = minutes_to_expire * 60 * 10**9
+        self._orders: dict[int, Order] = {}  # id -> order
+        # (期限切れになる時刻[ns], id). 削除済みの注文は取り出す時に読み飛ばす
+        self._expiry_heap: list[tuple[int, int]] = []
+        self._market_ids: dict[int, None] = {}  # 発注順を保つためdictで持つ
+        # (価格, id)の昇順
+        self._buy_prices: list[tuple[float, int]] = []
+        self._sell_prices: list[tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order: object) -> bool:
+        return isinstance(order, BaseOrder) and order.id in self._orders
+
+    @property
+    def orders(self) -> list[Order]:
+        return list(self._orders.values())
+
+    def _side_prices(self, order: LimitOrder) -> list[tuple[float, int]]:
+        return self._buy_prices if order.side == "BUY" else self._sell_prices
+
+    def add(self, order: Order) -> None:
+        self._orders[order.id] = order
+        heapq.heappush(
+            self._expiry_heap, (order.timestamp.value + self.expire_ns, order.id)
+        )
+        if isinstance(order, LimitOrder):
+            bisect.insort(self._side_prices(order), (order.price, order.id))
+        else:
+            self._market_ids[order.id] = None
+
+    def remove(self, order: Order) -> None:
+        del self._orders[order.id]
+        if isinstance(order, LimitOrder):
+            prices = self._side_prices(order)
+            i = bisect.bisect_left(prices, (order.price, order.id))
+            del prices[i]
+        else:
+            del self._market_ids[order.id]
+
+    def pop_expired(self, now_time: pd.Timestamp) -> list[Order]:
+        """
+        期限切れの注文を取り除き, 発注順(id順)に返す
+        """
+        expired: list[Order] = []
+        now = now_time.value
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, order_id = heapq.heappop(self._expiry_heap)
+            order = self._orders.get(order_id)
+            if order is not None:
+                self.remove(order)
+                expired.append(order)
+        # 発注時刻の順とidの順が違うこともあるので並べ直す. 1バーで期限切れになるのは僅か
+        expired.sort(key=lambda o: o.id)
+        return expired
+
+    def fill_candidates(self, low: float, high: float) -> list[Order]:
+        """
+        このバーで約定しうる注文を発注順(id順)に返す. 成行注文はすべて,
+        指値注文は従来の判定 (price > low or price < high) を満たすものを返す.
+        """
+        limit_ids: list[int] = []
+        for prices in (self._buy_prices, self._sell_prices):
+            above_low = bisect.bisect_right(prices, (low, float("inf")))
+            below_high = bisect.bisect_left(prices, (high, -1))
+            if above_low <= below_high:
+                limit_ids += [order_id for _, order_id in prices]
+            else:
+                limit_ids += [order_id for _, order_id in prices[:below_high]]
+                limit_ids += [order_id for _, order_id in prices[above_low:]]
+        # 成行注文のidは発注順に並んでいる
+        ids = heapq.merge(self._market_ids, sorted(limit_ids))
+        return [self._orders[order_id] for order_id in ids]
+
+    def resting(self, low: float, high: float) -> list[Order]:
+        """
+        fill_candidatesに含まれない指値注文 (high <= price <= low のもの)を発注順(id順)に返す
+        """
+        ids: list[int] = []
+        for prices in (self._buy_prices, self._sell_prices):
+            below_high = bisect.bisect_left(prices, (high, -1))
+            above_low = bisect.bisect_right(prices, (low, float("inf")))
+            ids += [order_id for _, order_id in prices[below_high:above_low]]
+        return [self._orders[order_id] for order_id in sorted(ids)]
+
+
+class OrderRegistry:
+    """
+    BackTesterに出された全注文をidとステータスで引けるように管理する.
+    ステータスごとのバケットはdictなので, 追加・移動・検索はO(1).
+    """
+
+    def __init__(self) -> None:
+        self._orders: dict[int, Order] = {}  # id -> order
+        self._buckets: dict[str, dict[int, Order]] = {
+            status: {} for status in ORDER_STATUSES
+        }
+        self._archived: list[Order] = []  # unexecuted以外になった順
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order: object) -> bool:
+        return isinstance(order, BaseOrder) and order.id in self._orders
+
+    def add(self, order: Order) -> None:
+        self._orders[order.id] = order
+        self._buckets[order.result.completion_status][order.id] = order
+
+    def archive(self, order: Order) -> None:
+        """
+        order.resultが確定した注文を, unexecutedから対応するバケットへ移す
+        """
+        del self._buckets["unexecuted"][order.id]
+        self._buckets[order.result.completion_status][order.id] = order
+        self._archived.append(order)
+
+    def get(self, order_id: int) -> Order | None:
+        return self._orders.get(order_id)
+
+    def status_of(self, order: Order) -> str | None:
+        registered = self._orders.get(order.id)
+        if registered is None:
+            return None
+        return registered.result.completion_status
+
+    def is_archived(self, order: Order) -> bool:
+        status = self.status_of(order)
+        return status is not None and status != "unexecuted"
+
+    def by_status(self, status: str) -> list[Order]:
+        return list(self._buckets[status].values())
+
+    def count(self, status: str) -> int:
+        return len(self._buckets[status])
+
+    @property
+    def archived(self) -> list[Order]:
+        return self._archived
+
+    def get_state(self) -> dict[str, Any]:
+        # 未約定の注文は後のバーでresultが書き換わるのでコピーする. 完了した注文は変わらない
+        return {
+            "unexecuted": copy.deepcopy(self.by_status("unexecuted")),
+            "archived": list(self._archived),
+        }
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """
+        get_stateの状態に戻す. バケットの順序(約定した順など)も元と同じになる.
+        """
+        self._orders = {}
+        self._buckets = {status: {} for status in ORDER_STATUSES}
+        self._archived = []
+        for order in state["archived"]:
+            self._orders[order.id] = order
+            self._buckets[order.result.completion_status][order.id] = order
+            self._archived.append(order)
+        for order in copy.deepcopy(state["unexecuted"]):
+            self.add(order)
+
+    def trade_log(self, status: str = "executed") -> pd.DataFrame:
+        """
+        指定したステータスの注文を1行1注文のDataFrameにする.
+        price列は指値注文のみ(成行はNaN).
+        """
+        orders = self._buckets[status].values()
+        return pd.DataFrame(
+            {
+                "id": [order.id for order in orders],
+                "type": [type(order).__name__ for order in orders],
+                "timestamp": [order.timestamp for order in orders],
+                "side": [order.side for order in orders],
+                "size": [order.size for order in orders],
+                "price": [getattr(order, "price", np.nan) for order in orders],
+                "completion_time": [order.result.completion_time for order in orders],
+                "cash_diff": [order.result.cash_diff for order in orders],
+                "position_diff": [order.result.position_diff for order in orders],
+            }
+        ).set_index("id")
+
+
 class PositionSnapShot(NamedTuple):
     timestamp: pd.Timestamp
     cash: float
@@ -81,6 +313,115 @@ class PositionSnapShot(NamedTuple):
     valuation: float  # position * (close value) + cash
 
 
+SNAPSHOT_DTYPE = np.dtype(
+    [
+        ("timestamp", np.int64),  # UNIXtime[ns]
+        ("cash", np.float64),
+        ("position", np.float64),
+        ("valuation", np.float64),
+    ]
+)
+
+
+class SnapshotRecorder:
+    """
+    PositionSnapShotの列を, 伸長可能なnumpyの構造化配列に記録する.
+    every > 1ならevery本に1本だけ記録する(間引き).
+    pathを指定するとバッファが埋まるたびにファイルへ追記し, メモリ上にはバッファ分だけ持つ.
+    """
+
+    def __init__(
+        self,
+        every: int = 1,
+        path: str | Path | None = None,
+        buffer_size: int = 65536,
+    ) -> None:
+        if every <= 0:
+            raise ValueError("every must be a positive number.")
+        self.every = every
+        # ファイルは最初のflushで作り直す (再開時に消さないように)
+        self.path = Path(path) if path is not None else None
+        self._buffer = np.empty(buffer_size, dtype=SNAPSHOT_DTYPE)
+        self._size = 0  # バッファ上の件数
+        self._num_flushed = 0  # ファイルに書き出した件数
+        self._num_appended = 0  # appendが呼ばれた回数(間引き前)
+        self._frame: pd.DataFrame | None = None
+
+    def __len__(self) -> int:
+        return self._num_flushed + self._size
+
+    def append(
+        self, timestamp: pd.Timestamp, cash: float, position: float, valuation: float
+    ) -> None:
+        self._num_appended += 1
+        if (self._num_appended - 1) % self.every != 0:
+            return
+        if self._size == len(self._buffer):
+            if self.path is not None:
+                self.flush()
+            else:
+                self._buffer = np.resize(self._buffer, 2 * len(self._buffer))
+        self._buffer[self._size] = (timestamp.value, cash, position, valuation)
+        self._size += 1
+        self._frame = None
+
+    def flush(self) -> None:
+        """
+        バッファの中身をファイルに追記する
+        """
+        if self.path is None or self._size == 0:
+            return
+        with open(self.path, "ab" if self._num_flushed else "wb") as f:
+            self._buffer[: self._size].tofile(f)
+        self._num_flushed += self._size
+        self._size = 0
+
+    def get_state(self) -> dict[str, Any]:
+        return {
+            "buffer": self._buffer[: self._size].copy(),
+            "num_flushed": self._num_flushed,
+            "num_appended": self._num_appended,
+        }
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        buffer = state["buffer"]
+        self._buffer = np.empty(max(len(self._buffer), len(buffer)), SNAPSHOT_DTYPE)
+        self._buffer[: len(buffer)] = buffer
+        self._size = len(buffer)
+        self._num_flushed = state["num_flushed"]
+        self._num_appended = state["num_appended"]
+        self._frame = None
+        if self.path is not None and self._num_flushed:
+            # チェックポイントより後にflushされた分を捨てる
+            os.truncate(self.path, self._num_flushed * SNAPSHOT_DTYPE.itemsize)
+
+    def to_array(self) -> np.ndarray:
+        buffered = self._buffer[: self._size]
+        if self.path is None or self._num_flushed == 0:
+            return buffered.copy()
+        flushed = np.fromfile(self.path, dtype=SNAPSHOT_DTYPE)
+        return np.concatenate([flushed, buffered])
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        次にappendされるまで, 作ったDataFrameを使い回す
+        """
+        if self._frame is None:
+            array = self.to_array()
+            index = pd.DatetimeIndex(
+                array["timestamp"].view("datetime64[ns]"), name="timestamp"
+            )
+            self._frame = pd.DataFrame(
+                {
+                    "cash": array["cash"],
+                    "position": array["position"],
+                    "valuation": array["valuation"],
+                },
+                index=index,
+            )
+        return self._frame
+
+
 class BackTester:
     def __init__(self, ohlcv_df: pd.DataFrame, config: dict[str, Any]) -> None:
         self.ohlcv_df = ohlcv_df
@@ -95,56 +436,178 @@ class BackTester:
             volume=0,
         )  # ダミーデータで初期化
         self.now_time: pd.Timestamp = self.tick.Index
+        self.cursor = 0  # 処理済みのバーの本数
 
-        self._snapshots: list[PositionSnapShot] = []
+        # config["snapshot_every"]本に1本だけ記録する. config["snapshot_path"]があればファイルに逃がす
+        self.recorder = SnapshotRecorder(
+            every=config.get("snapshot_every", 1),
+            path=config.get("snapshot_path"),
+        )
+        # 毎バー呼ばれるコールバック (戦略の指標更新など)
+        self._subscribers: list[Callable[[Tick], None]] = []
 
-        self.active_orders: list[Order] = []
-        self.archived_orders: list[Order] = []
+        self.order_registry = OrderRegistry()
         self.slippage: float = config["slippage"]  # 成行注文の時のスリッページ想定値
         self.minutes_to_expire: int = config["minutes_to_expire"]
-        self.cash: float = INITIAL_CASH  # amount of JPY
+        self.order_book = OrderBook(self.minutes_to_expire)
+        self.cash: float = config.get("initial_cash", INITIAL_CASH)  # amount of JPY
         self.position: float = 0  # amount of BTC
 
+        # config["profile"]がTrue(またはProfiler)なら段階ごとの所要時間を記録する
+        profile = config.get("profile", False)
+        self.profiler: Profiler | None = (
+            profile
+            if isinstance(profile, Profiler)
+            else Profiler() if profile else None
+        )
+
+    @property
+    def active_orders(self) -> list[Order]:
+        return self.order_book.orders
+
+    @property
+    def archived_orders(self) -> list[Order]:
+        return self.order_registry.archived
+
     def __iter__(self) -> "BackTester":
         return self
 
     def __next__(self) -> pd.Timestamp:
-        self.tick = next(self.ohlcv_it)
-        self.now_time = self.tick.Index
+        return self.step(next(self.ohlcv_it))
+
+    def step(self, tick: Tick) -> pd.Timestamp:
+        """
+        1本分進める. 複数のBackTesterで同じバーを共有する場合は外から呼ぶ.
+        """
+        if self.profiler is not None:
+            return self._profiled_step(tick, self.profiler)
+        self.cursor += 1
+        self.tick = tick
+        self.now_time = tick.Index
+        self.handle_orders()
+        self.take_snapshot()
+        for callback in self._subscribers:
+            callback(tick)
+        return self.now_time
+
+    def _profiled_step(self, tick: Tick, profiler: Profiler) -> pd.Timestamp:
+        """
+        stepと同じ処理をしながら, 段階ごとの所要時間を記録する
+        """
+        t0 = profiler.clock()
+        if profiler.started_ns is None:
+            profiler.started_ns = t0
+        self.cursor += 1
+        self.tick = tick
+        self.now_time = tick.Index
+        num_archived = len(self.order_registry.archived)
         self.handle_orders()
+        t1 = profiler.clock()
         self.take_snapshot()
+        t2 = profiler.clock()
+        for callback in self._subscribers:
+            callback(tick)
+        t3 = profiler.clock()
+
+        profiler.record("handle_orders", t1 - t0)
+        profiler.record("take_snapshot", t2 - t1)
+        if self._subscribers:
+            profiler.record("callbacks", t3 - t2)
+        profiler.count("bars")
+        profiler.count(
+            "orders_processed", len(self.order_registry.archived) - num_archived
+        )
+        profiler.stopped_ns = t3
         return self.now_time
 
+    def get_state(self) -> dict[str, Any]:
+        """
+        途中から再開するための状態. ohlcv_dfと購読者は含まない.
+        """
+        return {
+            "cursor": self.cursor,
+            "tick": tuple(self.tick),
+            "cash": self.cash,
+            "position": self.position,
+            "slippage": self.slippage,
+            "minutes_to_expire": self.minutes_to_expire,
+            "next_order_id": BaseOrder._id,
+            "orders": self.order_registry.get_state(),
+            "recorder": self.recorder.get_state(),
+        }
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """
+        get_stateの状態から再開する. ohlcv_dfは保存時のデータの末尾に新しいバーを足したもの.
+        """
+        if (state["slippage"], state["minutes_to_expire"]) != (
+            self.slippage,
+            self.minutes_to_expire,
+        ):
+            raise ValueError("config differs from the checkpoint.")
+        cursor = state["cursor"]
+        tick = Tick(*state["tick"])
+        if cursor > 0 and (
+            cursor > len(self.ohlcv_df) or self.ohlcv_df.index[cursor - 1] != tick.Index
+        ):
+            raise ValueError("ohlcv_df does not start with the checkpointed data.")
+
+        self.cursor = cursor
+        self.ohlcv_it = self.ohlcv_df.iloc[cursor:].itertuples(name="Tick")
+        self.tick = tick
+        self.now_time = tick.Index
+        self.cash = state["cash"]
+        self.position = state["position"]
+        # 新しい注文のidが既存の注文と被らないようにする
+        BaseOrder._id = max(BaseOrder._id, state["next_order_id"])
+        self.order_registry.set_state(state["orders"])
+        self.order_book = OrderBook(self.minutes_to_expire)
+        for order in self.order_registry.by_status("unexecuted"):
+            self.order_book.add(order)
+        self.recorder.set_state(state["recorder"])
+
+    def subscribe(self, callback: Callable[[Tick], None]) -> None:
+        """
+        各バーの処理後にcallback(tick)が呼ばれるようにする
+        """
+        self._subscribers.append(callback)
+
     def handle_orders(self) -> None:
-        remained_orders: list[Order] = []
-        for order in self.active_orders:
+        if not self.order_book:
+            return
+        low, high = self.tick.low, self.tick.high
+        # どれも発注順(id順)に並んでいる
+        expired = self.order_book.pop_expired(self.now_time)
+        candidates = self.order_book.fill_candidates(low, high)
+        # 約定候補でなくても, 従来通り有効性のチェックは毎バー行う
+        resting = self.order_book.resting(low, high)
+        expired_ids = {order.id for order in expired}
+        candidate_ids = {order.id for order in candidates}
+
+        # 従来と同じく, 発注順に1つずつ処理する
+        for order in heapq.merge(expired, candidates, resting, key=lambda o: o.id):
             # 有効期限が過ぎたものを削除
-            time_diff = self.now_time - order.timestamp
-            if time_diff.total_seconds() >= self.minutes_to_expire * 60:
+            if order.id in expired_ids:
                 order.result = OrderResult(self.now_time, "expired", None, None)
-                self.archived_orders.append(order)
+                self.order_registry.archive(order)
                 continue
 
             if not self.validate_order(order):
                 order.result = OrderResult(self.now_time, "invalid", None, None)
-                self.archived_orders.append(order)
+                self.order_book.remove(order)
+                self.order_registry.archive(order)
                 continue
 
             # 注文実行
-            if isinstance(order, MarketOrder) or (
-                isinstance(order, LimitOrder)
-                and ((order.price > self.tick.low) or (order.price < self.tick.high))
-            ):
+            if order.id in candidate_ids:
                 self.execute_order(order)
                 assert order.is_executed
-                self.archived_orders.append(order)
+                self.order_book.remove(order)
+                self.order_registry.archive(order)
                 continue
 
             # 実行されなかったものは残す
             assert order.is_unexecuted
-            remained_orders.append(order)
-
-        self.active_orders = remained_orders
 
     def validate_order(self, order: Order) -> bool:
         # check minimum lot
@@ -197,16 +660,14 @@ class BackTester:
 
     @property
     def snapshots(self) -> pd.DataFrame:
-        return pd.DataFrame(self._snapshots).set_index("timestamp")
+        return self.recorder.to_frame()
 
     def take_snapshot(self) -> None:
-        self._snapshots.append(
-            PositionSnapShot(
-                timestamp=self.now_time,
-                cash=self.cash,
-                position=self.position,
-                valuation=self.position * self.tick.close + self.cash,
-            )
+        self.recorder.append(
+            timestamp=self.now_time,
+            cash=self.cash,
+            position=self.position,
+            valuation=self.position * self.tick.close + self.cash,
         )
 
     def get_current_state(self):
@@ -222,14 +683,14 @@ class BackTester:
         保有cashを超える分の注文は買える最大値に変換される
         """
         order = MarketOrder(self.now_time, side="BUY", size=size)
-        self.active_orders.append(order)
+        self.add_order(order)
 
     def market_sell(self, size: float) -> None:
         """
         保有cashを超える分の注文は売れる最大値に変換される
         """
         order = MarketOrder(self.now_time, side="SELL", size=size)
-        self.active_orders.append(order)
+        self.add_order(order)
 
     def limit_buy(
         self,
@@ -237,7 +698,7 @@ class BackTester:
         price: int,
     ) -> None:
         order = LimitOrder(self.now_time, side="BUY", size=size, price=price)
-        self.active_orders.append(order)
+        self.add_order(order)
 
     def limit_sell(
         self,
@@ -245,10 +706,11 @@ class BackTester:
         price: int,
     ) -> None:
         order = LimitOrder(self.now_time, side="SELL", size=size, price=price)
-        self.active_orders.append(order)
+        self.add_order(order)
 
     def add_order(self, order: Order) -> None:
-        self.active_orders.append(order)
+        self.order_book.add(order)
+        self.order_registry.add(order)
 
 
 class myRunner:
@@ -271,22 +733,10 @@ class myRunner:
 
 
 if __name__ == "__main__":
-    # CSVデータを読み込む
-    df = pd.read_csv(
-        "../input_data/btf_periods900.csv",
-    )
-    # UNIXtimeをpandas.Timestampに変換する
-    df["CloseTime"] = pd.to_datetime(df["CloseTime"], unit="s")
-
-    rename_dict = {
-        "CloseTime": "timestamp",
-        "OpenPrice": "open",
-        "HighPrice": "high",
-        "LowPrice": "low",
-        "ClosePrice": "close",
-        "Volume": "volume",
-    }
-    df = df[list(rename_dict.keys())].rename(columns=rename_dict).set_index("timestamp")
+    from library.loader import read_ohlcv
+
+    # CSVデータを読み込む. indexはpandas.Timestampに変換されている
+    df = read_ohlcv("../input_data/btf_periods900.csv")
 
     config = {"slippage": 0.001, "minutes_to_expire": 60}
     tester = BackTester(df, config)
@@ -0,0 +1,180 @@
+import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from library.csv_tail import COLUMNS
+
+# pandasは重いので, DataFrameを扱う関数の中でだけimportする
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 1レコード56byteの固定長. CloseTimeはUNIXtime[s]
+OHLCV_DTYPE = np.dtype(
+    [("CloseTime", "<i8")] + [(column, "<f8") for column in COLUMNS[1:]]
+)
+STORE_SUFFIX = ".ohlcv"
+
+
+def is_store_path(path: str | Path) -> bool:
+    return Path(path).suffix == STORE_SUFFIX
+
+
+def to_records(data: Any) -> np.ndarray:
+    """
+    get_dataの戻り値(list of [unixtime, o, h, l, c, volume, quotevolume])や
+    DataFrameをOHLCV_DTYPEの構造化配列に変換する.
+    """
+    # DataFrameが渡されるならpandasは既にimportされている
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(data, pd.DataFrame):
+        records = np.empty(len(data), dtype=OHLCV_DTYPE)
+        for column in COLUMNS:
+            records[column] = data[column].to_numpy()
+        return records
+    return np.array([tuple(row) for row in data], dtype=OHLCV_DTYPE)
+
+
+def drop_non_numeric(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    gitのコンフリクトマーカーなど, 数値にできない値を含む行を除いて全ての列を数値にする.
+    """
+    import pandas as pd
+
+    if all(pd.api.types.is_numeric_dtype(df[column]) for column in df.columns):
+        return df
+    return df.apply(pd.to_numeric, errors="coerce").dropna()
+
+
+def to_frame(records: np.ndarray) -> "pd.DataFrame":
+    """
+    構造化配列をcsvと同じ列のDataFrameにする. 価格が整数ならcsvと同じくint64にする.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame({column: records[column] for column in COLUMNS})
+    price_columns = ["OpenPrice", "HighPrice", "LowPrice", "ClosePrice"]
+    if np.all(np.mod(df[price_columns].to_numpy(), 1) == 0):
+        df[price_columns] = df[price_columns].astype(np.int64)
+    return df
+
+
+class OHLCVStore:
+    """
+    CloseTime昇順の固定長バイナリファイルにOHLCVを保存する.
+    追記は末尾への書き込みだけで済み, 読み込みはmmapでCloseTimeの範囲を二分探索する.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        if not self.path.exists():
+            self.path.touch()
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.path) // OHLCV_DTYPE.itemsize
+
+    def _truncate_partial_record(self) -> None:
+        # 書き込み途中で落ちた場合の端数を捨てる
+        size = os.path.getsize(self.path)
+        aligned = size - size % OHLCV_DTYPE.itemsize
+        if aligned != size:
+            os.truncate(self.path, aligned)
+
+    def records(self) -> np.ndarray:
+        """
+        全レコードをmmapした読み取り専用の配列
+        """
+        n = len(self)
+        if n == 0:
+            return np.empty(0, dtype=OHLCV_DTYPE)
+        return np.memmap(self.path, dtype=OHLCV_DTYPE, mode="r", shape=(n,))
+
+    def last_close_time(self) -> int | None:
+        n = len(self)
+        if n == 0:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek((n - 1) * OHLCV_DTYPE.itemsize)
+            last = np.frombuffer(f.read(OHLCV_DTYPE.itemsize), dtype=OHLCV_DTYPE)
+        return int(last["CloseTime"][0])
+
+    def append(self, data: Any) -> int:
+        """
+        最後のCloseTimeより新しいレコードだけを末尾に追記し, 追記した件数を返す.
+        """
+        records = to_records(data)
+        if len(records) == 0:
+            return 0
+        if np.any(np.diff(records["CloseTime"]) <= 0):
+            raise ValueError("CloseTime must be strictly increasing.")
+        last = self.last_close_time()
+        if last is not None:
+            records = records[records["CloseTime"] > last]
+        if len(records) == 0:
+            return 0
+        self._truncate_partial_record()
+        with open(self.path, "ab") as f:
+            records.tofile(f)
+        return len(records)
+
+    def insert(self, data: Any) -> int:
+        """
+        まだないCloseTimeのレコードを昇順の位置に挿入し, 挿入した件数を返す.
+        最初に挿入する位置より前のレコードは書き換えない.
+        """
+        records = to_records(data)
+        _, index = np.unique(records["CloseTime"], return_index=True)
+        records = records[index]
+        existing = self.records()
+        records = records[~np.isin(records["CloseTime"], existing["CloseTime"])]
+        if len(records) == 0:
+            return 0
+        start = int(np.searchsorted(existing["CloseTime"], records["CloseTime"][0]))
+        tail = np.concatenate([existing[start:], records])
+        tail = tail[np.argsort(tail["CloseTime"], kind="stable")]
+        del existing
+        self._truncate_partial_record()
+        with open(self.path, "r+b") as f:
+            f.seek(start * OHLCV_DTYPE.itemsize)
+            tail.tofile(f)
+        return len(records)
+
+    def read(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        """
+        start <= CloseTime < end のレコード(mmapのview)を返す.
+
+        Args:
+            start (int | None): UNIXtime[s]. Noneなら先頭から.
+            end (int | None): UNIXtime[s]. Noneなら末尾まで.
+        """
+        records = self.records()
+        close_time = records["CloseTime"]
+        i = 0 if start is None else int(np.searchsorted(close_time, start, "left"))
+        j = len(records) if end is None else int(np.searchsorted(close_time, end))
+        return records[i:j]
+
+    def to_frame(
+        self, start: int | None = None, end: int | None = None
+    ) -> "pd.DataFrame":
+        return to_frame(self.read(start=start, end=end))
+
+    @classmethod
+    def from_csv(cls, csv_path: str | Path, path: str | Path) -> "OHLCVStore":
+        """
+        btf_periods*.csvを読み込んでストアを作る.
+        数値でない行は読み飛ばし, CloseTimeで重複を除いて昇順に並べる.
+        """
+        import pandas as pd
+
+        df = pd.read_csv(csv_path, dtype=str)
+        df = drop_non_numeric(df[COLUMNS])
+        df = df.drop_duplicates("CloseTime", keep="last").sort_values("CloseTime")
+        Path(path).write_bytes(b"")
+        store = cls(path)
+        store.append(df)
+        return store
+
+    def to_csv(self, csv_path: str | Path) -> None:
+        self.to_frame().to_csv(csv_path, index=False)
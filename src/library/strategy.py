@@ -1,10 +1,11 @@
 from abc import ABCMeta, abstractmethod
 from typing import NamedTuple
 
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
 
-from library.simulator import PositionSnapShot, Side
+from library.indicator import SMA, AbstractIndicator
+from library.simulator import PositionSnapShot, Side, SignalArrays, Tick
 
 
 class Signal(NamedTuple):
@@ -12,16 +13,36 @@ class Signal(NamedTuple):
     size: float
     exit_time: pd.Timestamp | None = None
     # この時刻を過ぎたら手仕舞いを始める
+    price: float | None = None
+    # 指値. Noneなら成行注文
 
 
 class AbstractStrategy(metaclass=ABCMeta):
     def __init__(self, df: pd.DataFrame) -> None:
         self.df = df
+        # on_tickで毎バー更新される指標
+        self.indicators: list[AbstractIndicator] = []
+        self.tick: Tick | None = None  # 最新のバー
+
+    def on_tick(self, tick: Tick) -> None:
+        """
+        BackTesterから毎バー呼ばれ, 指標を1本分だけ更新する
+        """
+        self.tick = tick
+        for indicator in self.indicators:
+            indicator.update(tick)
 
     @abstractmethod
     def get_signal(self, position_snap_shot: PositionSnapShot) -> Signal | None:
         pass
 
+    def compute_signals(self, df: pd.DataFrame) -> SignalArrays | None:
+        """
+        価格データだけで決まるシグナルを全バー分まとめて計算する.
+        実装しない戦略はNoneを返し, Runnerは毎バーget_signalを呼ぶ.
+        """
+        return None
+
 
 class GoldenCrossStrategy(AbstractStrategy):
     def __init__(
@@ -35,36 +56,45 @@ class GoldenCrossStrategy(AbstractStrategy):
         self.length_short = length_short
         self.length_long = length_long
         self.length_expire = length_expire
-        # 現在時刻からself.requiring_periods前までのデータを使って注文を出す
+        # シグナルが出始めるまでに必要なバーの本数
         self.requiring_periods = length_long + 1
 
-    # dfを, now_timeからself.requiring_periods前まで切り取る
-    # dfのindexは"timestamp", columnsは"open", "high", "low", "close", "volume"
-    def slice_df(self, now_time: pd.Timestamp) -> pd.DataFrame:
-        tmp_df = self.df[self.df.index <= now_time]
-        return tmp_df.iloc[-self.requiring_periods :]
+        self.sma_short = SMA(length=length_short)
+        self.sma_long = SMA(length=length_long)
+        self.indicators += [self.sma_short, self.sma_long]
 
     # main body
     def get_signal(self, position_snap_shot: PositionSnapShot) -> Signal | None:
+        assert self.tick is not None
         now_time = position_snap_shot.timestamp
         now_cash = position_snap_shot.cash
-        now_price = self.df.loc[now_time, "close"]
-
-        # ta.smaに渡すデータをなるべく小さくするため, 予めdfを切り取っておく
-        tmp_df = self.slice_df(now_time=now_time)
-
-        if len(tmp_df) >= self.length_long + 1:
-            sma_short = ta.sma(close=tmp_df["close"], length=self.length_short).values
-            sma_long = ta.sma(close=tmp_df["close"], length=self.length_long).values
-            if sma_short[-1] > sma_long[-1] and sma_short[-2] < sma_long[-2]:
-                # 買い注文
-                return Signal(
-                    side="BUY",
-                    size=now_cash * 0.5 / now_price,
-                    exit_time=now_time + pd.Timedelta(seconds=900 * self.length_expire),
-                )
+        now_price = self.tick.close
+
+        # 値が揃っていない間はNaNとの比較になりFalseになる
+        if (
+            self.sma_short.value > self.sma_long.value
+            and self.sma_short.prev_value < self.sma_long.prev_value
+        ):
+            # 買い注文
+            return Signal(
+                side="BUY",
+                size=now_cash * 0.5 / now_price,
+                exit_time=now_time + pd.Timedelta(seconds=900 * self.length_expire),
+            )
         return None
 
+    def compute_signals(self, df: pd.DataFrame) -> SignalArrays:
+        close = df["close"]
+        sma_short = close.rolling(self.length_short).mean()
+        sma_long = close.rolling(self.length_long).mean()
+        is_cross = (sma_short > sma_long) & (sma_short.shift(1) < sma_long.shift(1))
+        n = len(df)
+        return SignalArrays(
+            side=is_cross.to_numpy().astype(np.int8),
+            size_fraction=np.full(n, 0.5),
+            exit_offset=np.full(n, 900 * self.length_expire, dtype=np.int64),
+        )
+
 
 class FridayBuyStrategy(AbstractStrategy):
     def __init__(
@@ -77,9 +107,10 @@ class FridayBuyStrategy(AbstractStrategy):
         """
         金曜夜00:00に買って土曜00:00に売る
         """
+        assert self.tick is not None
         now_time = position_snap_shot.timestamp
         now_cash = position_snap_shot.cash
-        now_price = self.df.loc[now_time, "close"]
+        now_price = self.tick.close
 
         if now_time.dayofweek == 4 and now_time.hour == 0:
             return Signal(
@@ -88,3 +119,13 @@ class FridayBuyStrategy(AbstractStrategy):
                 exit_time=now_time + pd.Timedelta(days=1),
             )
         return None
+
+    def compute_signals(self, df: pd.DataFrame) -> SignalArrays:
+        index = pd.DatetimeIndex(df.index)
+        is_friday = (index.dayofweek == 4) & (index.hour == 0)
+        n = len(df)
+        return SignalArrays(
+            side=np.asarray(is_friday, dtype=np.int8),
+            size_fraction=np.full(n, 0.5),
+            exit_offset=np.full(n, 86400, dtype=np.int64),
+        )
@@ -0,0 +1,151 @@
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import pandas as pd
+
+from library.analytics import compute_metrics
+from library.array_simulator import ArrayBackTester
+from library.runner import Runner
+from library.simulator import ORDER_STATUSES, BackTester
+from library.strategy import AbstractStrategy
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+# BackTesterのconfigに渡すパラメータ. それ以外は戦略の引数として扱う
+CONFIG_KEYS = ("slippage", "minutes_to_expire", "initial_cash")
+DEFAULT_CONFIG: dict[str, Any] = {"slippage": 0.001, "minutes_to_expire": 60}
+
+Engine = Literal["runner", "array"]
+
+# ワーカープロセスごとに1回だけ設定される
+_shared_df: pd.DataFrame | None = None
+_strategy_cls: type[AbstractStrategy] | None = None
+_engine: Engine = "runner"
+
+
+def expand_grid(param_grid: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    """
+    {"a": [1, 2], "b": [3]} -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+    """
+    keys = list(param_grid.keys())
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(param_grid[k] for k in keys))
+    ]
+
+
+def dump_ohlcv(ohlcv_df: pd.DataFrame, dir_path: Path) -> None:
+    """
+    ワーカーがmmapで共有できるよう, ohlcvを.npyとして書き出す.
+    価格は(5, n)のC-contiguousで持ち, 転置するとDataFrameの1ブロックにそのまま乗る.
+    """
+    times = ohlcv_df.index.values.astype("datetime64[ns]").astype(np.int64)
+    np.save(dir_path / "times.npy", times)
+    values = np.ascontiguousarray(ohlcv_df[OHLCV_COLUMNS].to_numpy(np.float64).T)
+    np.save(dir_path / "values.npy", values)
+
+
+def load_ohlcv(dir_path: Path) -> pd.DataFrame:
+    """
+    dump_ohlcvで書き出した配列をmmapし, コピーせずにDataFrameとして見せる.
+    """
+    times = np.load(dir_path / "times.npy", mmap_mode="r")
+    values = np.load(dir_path / "values.npy", mmap_mode="r")
+    index = pd.DatetimeIndex(times.view("datetime64[ns]"), name="timestamp")
+    return pd.DataFrame(values.T, index=index, columns=OHLCV_COLUMNS, copy=False)
+
+
+def _init_worker(
+    dir_path: Path, strategy_cls: type[AbstractStrategy], engine: Engine
+) -> None:
+    global _shared_df, _strategy_cls, _engine
+    _shared_df = load_ohlcv(dir_path)
+    _strategy_cls = strategy_cls
+    _engine = engine
+
+
+def run_one(params: dict[str, Any]) -> dict[str, Any]:
+    """
+    1組のパラメータでバックテストを回し, 結果を1行分のdictで返す
+    """
+    assert _shared_df is not None and _strategy_cls is not None
+    config = dict(DEFAULT_CONFIG)
+    strategy_kwargs: dict[str, Any] = {}
+    for key, value in params.items():
+        if key in CONFIG_KEYS:
+            config[key] = value
+        else:
+            strategy_kwargs[key] = value
+
+    strategy = _strategy_cls(df=_shared_df, **strategy_kwargs)
+    if _engine == "array":
+        signals = strategy.compute_signals(_shared_df)
+        if signals is None:
+            raise ValueError("array engine requires compute_signals.")
+        array_tester = ArrayBackTester(_shared_df, config)
+        array_tester.run(signals)
+        snapshots = array_tester.snapshots
+        statuses = [order.completion_status for order in array_tester.orders]
+        counts = {status: statuses.count(status) for status in ORDER_STATUSES}
+    else:
+        tester = BackTester(_shared_df, config)
+        Runner(tester=tester, strategy=strategy).run()
+        snapshots = tester.snapshots
+        counts = {
+            status: tester.order_registry.count(status) for status in ORDER_STATUSES
+        }
+
+    metrics = compute_metrics(
+        snapshots.index.values,
+        snapshots["cash"].to_numpy(),
+        snapshots["valuation"].to_numpy(),
+    )
+    return {
+        **params,
+        **metrics.iloc[0].to_dict(),
+        "num_executed": counts["executed"],
+        "num_expired": counts["expired"],
+        "num_invalid": counts["invalid"],
+    }
+
+
+def run_sweep(
+    ohlcv_df: pd.DataFrame,
+    strategy_cls: type[AbstractStrategy],
+    param_grid: dict[str, list[Any]],
+    max_workers: int | None = None,
+    engine: Engine = "runner",
+) -> pd.DataFrame:
+    """
+    パラメータグリッドの全組み合わせをプロセスプールで並列にバックテストする.
+
+    Args:
+        ohlcv_df (pd.DataFrame): indexが"timestamp", columnsが"open", "high", "low",
+            "close", "volume"のデータ.
+        strategy_cls (type[AbstractStrategy]): 戦略のクラス.
+        param_grid (dict[str, list]): パラメータ名と候補のリスト.
+            CONFIG_KEYSはBackTesterのconfigに, それ以外は戦略に渡す.
+        max_workers (int | None): プロセス数. 1ならプールを使わずに実行する.
+        engine (str): "runner"ならRunner + BackTester, "array"ならArrayBackTester.
+
+    Returns:
+        pd.DataFrame: 1行が1組のパラメータ. analytics.compute_metricsの評価指標と約定数など.
+    """
+    param_list = expand_grid(param_grid)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dir_path = Path(tmp_dir)
+        dump_ohlcv(ohlcv_df, dir_path)
+        if max_workers == 1:
+            _init_worker(dir_path, strategy_cls, engine)
+            results = [run_one(params) for params in param_list]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(dir_path, strategy_cls, engine),
+            ) as executor:
+                results = list(executor.map(run_one, param_list, chunksize=1))
+    return pd.DataFrame(results)
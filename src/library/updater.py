@@ -0,0 +1,217 @@
+import datetime as dt
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+import requests
+
+from library import csv_tail
+from library.bucket import AbstractBucket
+from library.crawler import BASE_URL, backfill
+
+# 定期実行の大半は何もしないので, pandasはcompactionなど全体を読む時にだけimportする
+if TYPE_CHECKING:
+    import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+COMPACT_EVERY = 24  # 差分ファイルがこの数だけ溜まったら本体に統合する
+
+# manifestの1期間分: {"last_close_time": int, "segments": [差分ファイルの名前, ...]}
+ManifestEntry = dict[str, Any]
+
+
+class DeltaUpdater:
+    """
+    バケット上のbtf_periods*.csvを差分だけで更新する.
+
+    - manifest.jsonに各足の最後のCloseTimeを持つので, 本体のcsvはダウンロードしない
+    - 新しい足が確定していなければAPIも呼ばない
+    - 新しい足はsegments/以下に小さなcsvとしてアップロードし, COMPACT_EVERY個溜まったら
+      本体と統合(compaction)する
+    - 全ての足を並列に更新し, バケットとAPIのコネクションは使い回す
+    """
+
+    def __init__(
+        self,
+        bucket: AbstractBucket,
+        storage_dir: str = "data",
+        compact_every: int = COMPACT_EVERY,
+        session: requests.Session | None = None,
+        base_url: str = BASE_URL,
+    ) -> None:
+        """
+        Args:
+            bucket (AbstractBucket): Ex. GCSBucket, テストではLocalBucket.
+            storage_dir (str): バケット内のディレクトリ.
+            compact_every (int): compactionするまでの差分ファイルの数.
+            session (requests.Session | None): APIのコネクションを使い回すSession.
+            base_url (str): APIのURL.
+        """
+        self.bucket = bucket
+        self.storage_dir = storage_dir
+        self.compact_every = compact_every
+        self.session = session
+        self.base_url = base_url
+
+    def object_name(self, periods: int) -> str:
+        return f"{self.storage_dir}/btf_periods{periods}.csv"
+
+    def segment_name(self, periods: int, first: int, last: int) -> str:
+        return f"{self.storage_dir}/segments/btf_periods{periods}/{first:010d}-{last:010d}.csv"
+
+    @property
+    def manifest_name(self) -> str:
+        return f"{self.storage_dir}/{MANIFEST_NAME}"
+
+    def load_manifest(self) -> dict[str, ManifestEntry]:
+        data = self.bucket.download(self.manifest_name)
+        return {} if data is None else json.loads(data)
+
+    def save_manifest(self, manifest: dict[str, ManifestEntry]) -> None:
+        self.bucket.upload(
+            self.manifest_name, json.dumps(manifest, indent=2, sort_keys=True).encode()
+        )
+
+    def _read_csv(self, name: str) -> "pd.DataFrame":
+        import pandas as pd
+
+        from library.storage import drop_non_numeric
+
+        data = self.bucket.download(name)
+        if data is None:
+            raise FileNotFoundError(name)
+        # 本体にはgitのコンフリクトマーカーなど数値でない行が混ざっていることがある
+        df = pd.read_csv(io.BytesIO(data), usecols=csv_tail.COLUMNS, dtype=str)
+        return drop_non_numeric(df)
+
+    def read_frame(
+        self, periods: int, entry: ManifestEntry | None = None
+    ) -> "pd.DataFrame":
+        """
+        本体と差分を結合した全データ. CloseTimeの昇順で, compaction途中で落ちた場合に
+        備えて重複は除く(差分の方を残す).
+        """
+        import numpy as np
+        import pandas as pd
+
+        from library.storage import to_frame, to_records
+
+        if entry is None:
+            entry = self.load_manifest().get(str(periods), {"segments": []})
+        frames = [self._read_csv(self.object_name(periods))]
+        frames += [self._read_csv(name) for name in entry["segments"]]
+        df = pd.concat(frames, ignore_index=True).astype({"CloseTime": np.int64})
+        # 安定ソートなので, 同じCloseTimeでは後から読んだ差分が後ろに来る
+        df = df.sort_values("CloseTime", kind="stable")
+        df = df.drop_duplicates("CloseTime", keep="last")
+        # 数値にする時にfloatになった価格を, csvと同じく整数に戻す
+        return to_frame(to_records(df))
+
+    def _bootstrap(self, periods: int) -> ManifestEntry:
+        # manifestがない足だけ, 本体の末尾を読んで最後のCloseTimeを調べる
+        name = self.object_name(periods)
+        n_bytes = csv_tail.BLOCK_SIZE
+        while True:
+            data = self.bucket.download_tail(name, n_bytes)
+            if data is None:
+                raise FileNotFoundError(name)
+            is_head = len(data) < n_bytes
+            close_time = csv_tail.last_close_time_in(data, is_head=is_head)
+            if close_time is not None:
+                return {"last_close_time": close_time, "segments": []}
+            if is_head:
+                raise ValueError(f"{name} has no data.")
+            n_bytes *= 2
+
+    def update(
+        self, periods: int, entry: ManifestEntry | None, now: dt.datetime
+    ) -> tuple[ManifestEntry, list[str]]:
+        """
+        1つの足を更新する.
+
+        Returns:
+            (新しいmanifestの値, manifestを保存した後に消してよい差分ファイル)
+        """
+        if entry is None:
+            entry = self._bootstrap(periods)
+        last_close_time = entry["last_close_time"]
+        # 次の足がまだ確定していない
+        if last_close_time + periods > now.timestamp():
+            return entry, []
+
+        after = dt.datetime.fromtimestamp(last_close_time + periods)
+        data = backfill(
+            periods,
+            now,
+            after,
+            max_workers=1,
+            session=self.session,
+            base_url=self.base_url,
+        )
+        data = [row for row in data if row[0] > last_close_time]
+        if len(data) == 0:
+            return entry, []
+
+        name = self.segment_name(periods, int(data[0][0]), int(data[-1][0]))
+        self.bucket.upload(name, csv_tail.format_rows(data).encode())
+        entry = {
+            "last_close_time": int(data[-1][0]),
+            "segments": entry["segments"] + [name],
+        }
+        print(
+            f"btf_periods{periods}: {len(data)} bars from "
+            f"{dt.datetime.fromtimestamp(data[0][0])} to "
+            f"{dt.datetime.fromtimestamp(data[-1][0])} are uploaded"
+        )
+
+        if len(entry["segments"]) >= self.compact_every:
+            return self.compact(periods, entry)
+        return entry, []
+
+    def compact(
+        self, periods: int, entry: ManifestEntry
+    ) -> tuple[ManifestEntry, list[str]]:
+        """
+        差分を本体に統合してアップロードする. 差分ファイルの削除はmanifestの保存後に行う.
+        """
+        df = self.read_frame(periods, entry)
+        self.bucket.upload(self.object_name(periods), df.to_csv(index=False).encode())
+        print(f"btf_periods{periods}: {len(entry['segments'])} segments are compacted")
+        return {**entry, "segments": []}, list(entry["segments"])
+
+    def run(
+        self, periods_list: list[int], now: dt.datetime | None = None
+    ) -> dict[str, ManifestEntry]:
+        """
+        全ての足を並列に更新し, manifestを1回だけ保存する.
+        一部の足で失敗しても, 成功した足のmanifestは保存してから例外を投げ直す.
+        """
+        now = now or dt.datetime.now()
+        manifest = self.load_manifest()
+        old_manifest = json.dumps(manifest, sort_keys=True)
+        with ThreadPoolExecutor(max_workers=len(periods_list)) as executor:
+            futures = {
+                periods: executor.submit(
+                    self.update, periods, manifest.get(str(periods)), now
+                )
+                for periods in periods_list
+            }
+        garbage: list[str] = []
+        errors: list[BaseException] = []
+        for periods, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+                continue
+            entry, names = future.result()
+            manifest[str(periods)] = entry
+            garbage += names
+
+        if json.dumps(manifest, sort_keys=True) != old_manifest:
+            self.save_manifest(manifest)
+        for name in garbage:
+            self.bucket.delete(name)
+        if errors:
+            raise errors[0]
+        return manifest
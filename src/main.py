@@ -1,38 +1,31 @@
 from pathlib import Path
 
 import functions_framework
-from google.cloud.storage import Client
 
-from library.crawler import add_data
+from library.bucket import GCSBucket
+from library.crawler import make_session
+from library.updater import DeltaUpdater
 
-WORK_DIR = Path("/tmp")
 BUCKET_NAME = "crypto_data192"
 STORAGE_DIR = Path("data")
 PERIODS = [60, 300, 900, 3600, 86400]
 
+# インスタンスが再利用される間はクライアント(とコネクション)を使い回す.
+# google.cloud.storageやpandasはimportが重いので, 起動時ではなく使う時にimportする
+_bucket: GCSBucket | None = None
 
-@functions_framework.cloud_event
-def run(cloud_event) -> None:
-    for period in PERIODS:
-        update_data(period)
-
-
-def update_data(period: int) -> None:
-    file_name = f"btf_periods{period}.csv"
-    fetch_current_data_from_storage(file_name=file_name)
-    add_data(periods=period, save_path=WORK_DIR / file_name)
-    upload_to_storage(file_name=file_name)
 
+def get_bucket() -> GCSBucket:
+    global _bucket
+    if _bucket is None:
+        _bucket = GCSBucket(BUCKET_NAME)
+    return _bucket
 
-def fetch_current_data_from_storage(file_name: str) -> None:
-    client = Client()
-    bucket = client.bucket(BUCKET_NAME)
-    blob = bucket.blob(str(STORAGE_DIR / file_name))
-    blob.download_to_filename(str(WORK_DIR / file_name))
 
-
-def upload_to_storage(file_name: str) -> None:
-    client = Client()
-    bucket = client.bucket(BUCKET_NAME)
-    blob = bucket.blob(str(STORAGE_DIR / file_name))
-    blob.upload_from_filename(str(WORK_DIR / file_name))
+@functions_framework.cloud_event
+def run(cloud_event) -> None:
+    with make_session(pool_size=len(PERIODS)) as session:
+        updater = DeltaUpdater(
+            get_bucket(), storage_dir=STORAGE_DIR.as_posix(), session=session
+        )
+        updater.run(PERIODS)
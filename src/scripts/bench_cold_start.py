@@ -0,0 +1,177 @@
+"""
+取り込み処理(main.run)の起動の速さを測る. srcディレクトリで実行する.
+
+    python -m scripts.bench_cold_start --repeat 5 --json cold_start.json
+
+- import: 各モジュールを新しいプロセスでimportする時間と, 一緒に読み込まれる重いモジュール
+- cold_start: 新しいプロセスでLocalBucketに対してDeltaUpdater.runを実行する時間
+  (idle: 新しい足がなく何もしない場合, bootstrap: manifestがなく本体の末尾を読む場合)
+- last_close_time: csvの最後のCloseTimeを末尾から読む場合とpandasで全体を読む場合
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+INPUT_DIR = SRC_DIR / "input_data"
+MODULES = [
+    "library.csv_tail",
+    "library.bucket",
+    "library.crawler",
+    "library.updater",
+    "library.storage",
+]
+HEAVY_MODULES = ["numpy", "pandas", "google.cloud.storage"]
+PERIODS = [60, 300, 900, 3600, 86400]
+
+IMPORT_CODE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+# 全ての足のmanifestが最新なら, APIもpandasも使わずに終わるはず
+COLD_START_CODE = """
+import sys, time
+start = time.perf_counter()
+import datetime as dt
+from library.bucket import LocalBucket
+from library.updater import DeltaUpdater
+updater = DeltaUpdater(LocalBucket({root!r}), base_url="http://127.0.0.1:9/")
+manifest = updater.run({periods!r}, now=dt.datetime.fromtimestamp({now!r}))
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def run_python(code: str) -> tuple[float, float, str]:
+    """
+    新しいプロセスでcodeを実行する.
+
+    Returns:
+        (プロセス全体の時間[s], code内で測った時間[s], 読み込まれた重いモジュール)
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - start
+    elapsed, _, heavy = result.stdout.strip().splitlines()[-1].partition(" ")
+    return wall, float(elapsed), heavy
+
+
+def measure(code: str, repeat: int) -> dict[str, Any]:
+    results = [run_python(code) for _ in range(repeat)]
+    return {
+        "wall_s": statistics.median(wall for wall, _, _ in results),
+        "in_process_s": statistics.median(elapsed for _, elapsed, _ in results),
+        "heavy_modules": results[-1][2],
+    }
+
+
+def prepare_bucket(root: Path, with_manifest: bool) -> int:
+    """
+    input_dataのcsvをLocalBucketに置く. 最新の足のCloseTimeを返す.
+    """
+    from library import csv_tail
+
+    manifest: dict[str, Any] = {}
+    for periods in PERIODS:
+        path = INPUT_DIR / f"btf_periods{periods}.csv"
+        (root / "data").mkdir(parents=True, exist_ok=True)
+        shutil.copy(path, root / "data" / path.name)
+        last_close_time = csv_tail.last_close_time(path)
+        manifest[str(periods)] = {"last_close_time": last_close_time, "segments": []}
+    if with_manifest:
+        (root / "data" / "manifest.json").write_text(json.dumps(manifest))
+    # 一番短い足でも次の足が確定していない時刻
+    return min(entry["last_close_time"] for entry in manifest.values()) + 1
+
+
+def bench_last_close_time(repeat: int) -> dict[str, Any]:
+    import pandas as pd
+
+    from library import csv_tail
+
+    path = INPUT_DIR / "btf_periods60.csv"
+    tail_s, pandas_s = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tail = csv_tail.last_close_time(path)
+        tail_s.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        df = pd.read_csv(path, dtype=str)
+        close_time = pd.to_numeric(df["CloseTime"], errors="coerce").dropna()
+        pandas_s.append(time.perf_counter() - start)
+        assert tail == int(close_time.values[-1])
+    return {
+        "file": path.name,
+        "tail_s": statistics.median(tail_s),
+        "pandas_s": statistics.median(pandas_s),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", type=Path, default=None, help="結果の保存先")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC_DIR))
+    results: dict[str, Any] = {"python": sys.version.split()[0], "import": {}}
+    for module in MODULES + ["pandas"]:
+        code = IMPORT_CODE.format(module=module, heavy=HEAVY_MODULES)
+        results["import"][module] = measure(code, args.repeat)
+
+    results["cold_start"] = {}
+    for case, with_manifest in [("idle", True), ("bootstrap", False)]:
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as root:
+                now = prepare_bucket(Path(root), with_manifest)
+                code = COLD_START_CODE.format(
+                    root=root, periods=PERIODS, now=now, heavy=HEAVY_MODULES
+                )
+                runs.append(run_python(code))
+        results["cold_start"][case] = {
+            "wall_s": statistics.median(wall for wall, _, _ in runs),
+            "in_process_s": statistics.median(elapsed for _, elapsed, _ in runs),
+            "heavy_modules": runs[-1][2],
+        }
+    results["last_close_time"] = bench_last_close_time(args.repeat)
+
+    for section in ["import", "cold_start"]:
+        print(f"[{section}]")
+        for name, result in results[section].items():
+            print(
+                f"  {name:<20} wall {result['wall_s'] * 1e3:8.1f}ms  "
+                f"in-process {result['in_process_s'] * 1e3:8.1f}ms  "
+                f"heavy: {result['heavy_modules'] or '-'}"
+            )
+    last = results["last_close_time"]
+    print(
+        f"[last_close_time] {last['file']}: tail {last['tail_s'] * 1e3:.2f}ms, "
+        f"pandas {last['pandas_s'] * 1e3:.1f}ms"
+    )
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from pathlib import Path
 
-from google.cloud.storage import Client
+from library.bucket import GCSBucket
+from library.updater import DeltaUpdater
 
 WORK_DIR = Path("../input_data")
 BUCKET_NAME = "crypto_data192"
@@ -8,14 +9,13 @@ STORAGE_DIR = Path("data")
 PERIODS = [60, 300, 900, 3600, 86400]
 
 
-def fetch_data_from_storage(file_name: str) -> None:
-    client = Client()
-    bucket = client.bucket(BUCKET_NAME)
-    blob = bucket.blob(str(STORAGE_DIR / file_name))
-    blob.download_to_filename(str(WORK_DIR / file_name))
+def fetch_data_from_storage(updater: DeltaUpdater, periods: int) -> None:
+    # 本体のcsvとまだ統合されていない差分を結合して保存する
+    df = updater.read_frame(periods)
+    df.to_csv(WORK_DIR / f"btf_periods{periods}.csv", index=False)
 
 
 if __name__ == "__main__":
+    updater = DeltaUpdater(GCSBucket(BUCKET_NAME), storage_dir=STORAGE_DIR.as_posix())
     for period in PERIODS:
-        file_name = f"btf_periods{period}.csv"
-        fetch_data_from_storage(file_name=file_name)
+        fetch_data_from_storage(updater, period)
@@ -0,0 +1,46 @@
+"""
+ペーパートレードを動かす. srcディレクトリで実行する.
+
+    # btf_periods60.csvをローカルのサーバーからライブのように配信して確かめる
+    python -m scripts.paper_trade --source replay --max-bars 5000
+    # bitFlyerの約定から1分足を作ってペーパートレードする
+    python -m scripts.paper_trade --source bitflyer
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from library.live import BitflyerBarFeed, LivePaperTrader, StreamBarFeed
+from library.loader import read_ohlcv
+from library.replay import ReplayServer
+from library.strategy import GoldenCrossStrategy
+
+INPUT_DIR = Path(__file__).resolve().parents[1] / "input_data"
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 60}
+
+
+async def main(args: argparse.Namespace) -> None:
+    df = read_ohlcv(INPUT_DIR / f"btf_periods{args.periods}.csv")
+    if args.source == "replay":
+        trader = LivePaperTrader(GoldenCrossStrategy(df), CONFIG)
+        async with ReplayServer(df, interval=args.interval) as server:
+            await trader.run(
+                StreamBarFeed(server.host, server.port), max_bars=args.max_bars
+            )
+    else:
+        # 保存済みの足で指標を温めてから始める
+        trader = LivePaperTrader(GoldenCrossStrategy(df), CONFIG, history=df)
+        await trader.run(BitflyerBarFeed(args.periods), max_bars=args.max_bars)
+
+    print(trader.tester.snapshots.tail())
+    print(trader.latency.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--source", choices=["replay", "bitflyer"], default="replay")
+    parser.add_argument("--periods", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=0.0, help="replayの間隔[s]")
+    parser.add_argument("--max-bars", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
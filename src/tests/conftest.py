@@ -0,0 +1,103 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+INPUT_DIR = SRC_DIR / "input_data"
+sys.path.insert(0, str(SRC_DIR))
+
+from library.array_simulator import ArrayBackTester  # noqa: E402
+from library.crawler import MAX_BARS  # noqa: E402
+from library.simulator import BackTester  # noqa: E402
+
+Trade = tuple[int, str, float, int, str, float | None, float | None]
+
+
+def unix_time(timestamp: Any) -> int:
+    return int(timestamp.timestamp())
+
+
+def backtester_trades(tester: BackTester) -> list[Trade]:
+    """
+    BackTesterの完了した注文を, ArrayBackTester.ordersと比べられる形にする.
+    注文のidは通し番号なので比べない.
+    """
+    return [
+        (
+            unix_time(order.timestamp),
+            order.side,
+            order.size,
+            unix_time(order.result.completion_time),
+            order.result.completion_status,
+            order.result.cash_diff,
+            order.result.position_diff,
+        )
+        for order in tester.order_registry.archived
+    ]
+
+
+def array_trades(tester: ArrayBackTester) -> list[Trade]:
+    return [tuple(order) for order in tester.orders]  # type: ignore[misc]
+
+
+class FakeCryptowatch:
+    """
+    cryptowatchのOHLC APIの代わりのローカルのHTTPサーバー.
+    after <= CloseTime <= before の足を, 1回あたり最大MAX_BARS件返す.
+    """
+
+    def __init__(self) -> None:
+        self.bars: dict[int, list[list]] = {}
+        self.requests: list[tuple[int, int, int]] = []  # (periods, after, before)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                query = parse_qs(urlparse(self.path).query)
+                periods = int(query["periods"][0])
+                before = int(query["before"][0])
+                after = int(query["after"][0])
+                fake.requests.append((periods, after, before))
+                rows = [
+                    row
+                    for row in fake.bars.get(periods, [])
+                    if after <= row[0] <= before
+                ][:MAX_BARS]
+                body = json.dumps({"result": {str(periods): rows}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/ohlc"
+
+    def serve(self, periods: int, start: int, n: int) -> list[list]:
+        """
+        startから始まるn本の足を用意する
+        """
+        self.bars[periods] = [
+            [start + periods * i, 100 + i, 101 + i, 99 + i, 100 + i, 1.5, 150.0]
+            for i in range(n)
+        ]
+        return self.bars[periods]
+
+
+@pytest.fixture
+def fake_api() -> Iterator[FakeCryptowatch]:
+    fake = FakeCryptowatch()
+    thread = threading.Thread(target=fake.server.serve_forever, daemon=True)
+    thread.start()
+    yield fake
+    fake.server.shutdown()
+    fake.server.server_close()
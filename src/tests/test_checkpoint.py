@@ -0,0 +1,40 @@
+import pandas as pd
+
+from library.loader import read_ohlcv
+from library.runner import Runner
+from library.simulator import BackTester, LimitOrder
+from library.strategy import GoldenCrossStrategy
+from tests.conftest import INPUT_DIR, backtester_trades
+
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 600}
+
+
+def make_runner(df: pd.DataFrame) -> Runner:
+    # 毎バーon_tickで指標を更新する経路なので, 指標の状態も保存される
+    strategy = GoldenCrossStrategy(df, length_short=15, length_long=30)
+    return Runner(BackTester(df, CONFIG), strategy, precompute=False)
+
+
+def test_state_is_not_changed_by_later_bars() -> None:
+    df = read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+    runner = make_runner(df)
+    for i, now_time in enumerate(runner.tester):
+        runner.step(i, now_time)
+        if i == 3000:
+            break
+    # 未約定の注文も含めて保存する
+    runner.tester.add_order(LimitOrder(runner.tester.now_time, "BUY", 1, 1))
+    tester_state = runner.tester.get_state()
+    runner_state = runner.get_state()
+    # 保存した後も同じプロセスで続ける
+    runner.run()
+
+    # 同じstateから2回再開しても, どちらも保存した時点から続く
+    for _ in range(2):
+        resumed = make_runner(df)
+        resumed.tester.set_state(tester_state)
+        resumed.set_state(runner_state)
+        resumed.run()
+        trades = backtester_trades(resumed.tester)
+        assert trades == backtester_trades(runner.tester)
+        pd.testing.assert_frame_equal(resumed.tester.snapshots, runner.tester.snapshots)
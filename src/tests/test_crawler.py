@@ -0,0 +1,38 @@
+import datetime as dt
+
+from library.crawler import MAX_BARS, backfill, split_windows
+from tests.conftest import FakeCryptowatch
+
+PERIODS = 60
+
+
+def test_split_windows_are_aligned_and_contiguous() -> None:
+    after = dt.datetime.fromtimestamp(1_700_000_017)  # 足の時刻に揃っていない
+    before = after + dt.timedelta(seconds=PERIODS * 15000)
+    windows = split_windows(PERIODS, before, after)
+
+    assert len(windows) == 3
+    for (_, window_before), (next_after, _) in zip(windows, windows[1:]):
+        assert int(window_before.timestamp()) % PERIODS == 0
+        assert next_after - window_before == dt.timedelta(seconds=PERIODS)
+    for window_after, window_before in windows:
+        assert window_before - window_after <= dt.timedelta(
+            seconds=PERIODS * (MAX_BARS - 1)
+        )
+
+
+def test_backfill_returns_contiguous_bars(fake_api: FakeCryptowatch) -> None:
+    start = 1_700_000_040
+    n = 15000
+    bars = fake_api.serve(PERIODS, start, n)
+    # get_new_dataと同じく, 足の時刻に揃っていないafterから取得する
+    after = dt.datetime.fromtimestamp(start - 23)
+    before = dt.datetime.fromtimestamp(start + PERIODS * (n - 1) + 5)
+
+    data = backfill(PERIODS, before, after, max_workers=3, base_url=fake_api.url)
+
+    assert len(data) == n
+    close_time = [row[0] for row in data]
+    assert close_time == [row[0] for row in bars]
+    assert all(b - a == PERIODS for a, b in zip(close_time, close_time[1:]))
+    assert len(fake_api.requests) == 3
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from library.dataset import iter_frame_folds
+from library.feature_cache import FeatureCache, FeatureSpec, make_planner
+from library.loader import read_ohlcv
+from tests.conftest import INPUT_DIR
+
+SPEC: FeatureSpec = [("vola", [10]), ("roc", [5, 10])]
+N_FOLDS = 4
+
+
+@pytest.fixture
+def features(tmp_path: Path) -> pd.DataFrame:
+    df = read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+    return FeatureCache(tmp_path).get_features(df, "btf_periods900", SPEC)
+
+
+@pytest.mark.parametrize("label_index", [0, -1, 3])
+def test_iter_frame_folds_matches_copied_arrays(
+    features: pd.DataFrame, label_index: int
+) -> None:
+    label_column = str(features.columns[label_index])
+    x = features.drop(columns=[label_column]).to_numpy(np.float64)
+    y = features[label_column].to_numpy(np.float64)
+    planner = make_planner(SPEC)
+
+    folds = list(iter_frame_folds(features, label_column, N_FOLDS, planner))
+    assert len(folds) == N_FOLDS
+    for fold in folds:
+        np.testing.assert_array_equal(fold.x_train, x[fold.train])
+        np.testing.assert_array_equal(fold.y_train, y[fold.train])
+        np.testing.assert_array_equal(fold.x_test, x[fold.test])
+        np.testing.assert_array_equal(fold.y_test, y[fold.test])
+
+
+def test_iter_frame_folds_does_not_copy_cached_features(
+    features: pd.DataFrame,
+) -> None:
+    cached = features.to_numpy(copy=False)
+    # FeatureCacheのDataFrameはvalues.binのmemmapを包んでいる
+    base = cached
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert base is not None
+
+    label_column = str(features.columns[-1])
+    planner = make_planner(SPEC)
+    for fold in iter_frame_folds(features, label_column, N_FOLDS, planner):
+        for array in [fold.x_train, fold.y_train, fold.x_test, fold.y_test]:
+            assert np.shares_memory(array, cached)
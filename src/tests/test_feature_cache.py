@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from library.feature_cache import FeatureCache, FeatureSpec
+from library.loader import read_ohlcv
+from tests.conftest import INPUT_DIR
+
+# 指数平滑系(atr, rsi, macd, rvi)を含める
+SPEC: FeatureSpec = [("vola", [10, 20]), ("momentum", [10, 20]), ("roc", [5])]
+N_CACHED = 5000
+
+
+@pytest.fixture(scope="module")
+def ohlcv() -> pd.DataFrame:
+    return read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+
+
+def test_appended_features_match_full_computation(
+    tmp_path: Path, ohlcv: pd.DataFrame
+) -> None:
+    cache = FeatureCache(tmp_path / "cache")
+    cache.get_features(ohlcv.iloc[:N_CACHED], "btf_periods900", SPEC)
+    appended = cache.get_features(ohlcv, "btf_periods900", SPEC)
+    full = FeatureCache(tmp_path / "full").get_features(ohlcv, "btf_periods900", SPEC)
+
+    pd.testing.assert_index_equal(appended.index, full.index)
+    assert list(appended.columns) == list(full.columns)
+    # ウォームアップ(WARMUP_MULTIPLIER)分遡れば, 指数平滑系も全期間の計算と一致する
+    np.testing.assert_allclose(
+        appended.to_numpy(), full.to_numpy(), rtol=1e-8, atol=1e-8, equal_nan=True
+    )
+
+
+def test_interrupted_append_is_truncated(tmp_path: Path, ohlcv: pd.DataFrame) -> None:
+    cache = FeatureCache(tmp_path / "cache")
+    cache.get_features(ohlcv.iloc[:N_CACHED], "btf_periods900", SPEC)
+    expected = FeatureCache(tmp_path / "expected")
+    expected.get_features(ohlcv.iloc[:N_CACHED], "btf_periods900", SPEC)
+
+    # meta.jsonを書き換える前に中断した追記を再現する
+    (entry,) = [path for path in (tmp_path / "cache").iterdir() if path.is_dir()]
+    for name in ["times.bin", "values.bin"]:
+        with open(entry / name, "ab") as f:
+            f.write(b"\xff" * 1000)
+
+    actual = cache.get_features(ohlcv, "btf_periods900", SPEC)
+    pd.testing.assert_frame_equal(
+        actual, expected.get_features(ohlcv, "btf_periods900", SPEC)
+    )
+    assert (entry / "times.bin").stat().st_size == len(ohlcv) * 8
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from library.feature_extractor import THRESHOLD, add_features, add_hv
+from library.loader import read_ohlcv
+from tests.conftest import INPUT_DIR
+
+# 価格は6e6円程度なので, smaは相対誤差で比べる
+RTOL = 1e-12
+ATOL = 1e-12
+FLOAT32_RTOL = 1e-6
+
+
+def reference_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    ベクトル化する前のadd_features(pandasのrollingとapply)
+    """
+    df = df.copy()
+    for length in [10, 20, 50]:
+        df[f"sma_{length}"] = df["close"].rolling(length).mean()
+    df["return"] = df["close"].pct_change().shift(-1)
+    df["hv_10"] = (
+        np.log(df["return"].astype(float) + 1.0).rolling(window=10, min_periods=1).std()
+    )
+    df["mask"] = df["hv_10"].apply(lambda x: 1 if abs(x) > THRESHOLD else 0)
+    return df
+
+
+@pytest.fixture(params=[60, 900, 86400])
+def ohlcv(request: pytest.FixtureRequest) -> pd.DataFrame:
+    return read_ohlcv(INPUT_DIR / f"btf_periods{request.param}.csv", compact=False)
+
+
+def test_add_features_matches_pandas_rolling(ohlcv: pd.DataFrame) -> None:
+    expected = reference_features(ohlcv)
+    actual = add_features(ohlcv.copy())
+
+    assert list(actual.columns) == list(expected.columns)
+    for column in ["sma_10", "sma_20", "sma_50", "return", "hv_10"]:
+        np.testing.assert_allclose(
+            actual[column].to_numpy(),
+            expected[column].to_numpy(),
+            rtol=RTOL,
+            atol=ATOL,
+            equal_nan=True,
+            err_msg=column,
+        )
+    np.testing.assert_array_equal(actual["mask"], expected["mask"])
+
+
+def test_add_features_float32(ohlcv: pd.DataFrame) -> None:
+    expected = add_features(ohlcv.copy())
+    actual = add_features(ohlcv.copy(), dtype=np.float32)
+
+    assert (actual["hv_10"].dtype, actual["sma_10"].dtype) == (np.float32, np.float32)
+    for column in ["sma_10", "sma_20", "sma_50", "return", "hv_10"]:
+        np.testing.assert_allclose(
+            actual[column].to_numpy(np.float64),
+            expected[column].to_numpy(),
+            rtol=FLOAT32_RTOL,
+            equal_nan=True,
+            err_msg=column,
+        )
+    np.testing.assert_array_equal(actual["mask"], expected["mask"])
+
+
+def test_add_hv_matches_pandas_rolling(ohlcv: pd.DataFrame) -> None:
+    df = ohlcv.copy()
+    df["return"] = df["close"].pct_change().shift(-1)
+    with np.errstate(divide="ignore"):
+        log_return = np.log(df["return"] + 1.0)
+    expected = log_return.rolling(window=20, min_periods=1).std()
+
+    actual = add_hv(df, 20)["hv_20"]
+    np.testing.assert_allclose(
+        actual.to_numpy(), expected.to_numpy(), rtol=RTOL, atol=ATOL, equal_nan=True
+    )
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from library.live import BarAggregator, LivePaperTrader, StreamBarFeed
+from library.loader import read_ohlcv
+from library.replay import ReplayServer
+from library.resampler import bucket_close_time
+from library.runner import Runner
+from library.simulator import BackTester
+from library.strategy import AbstractStrategy, FridayBuyStrategy, GoldenCrossStrategy
+from tests.conftest import INPUT_DIR, backtester_trades
+
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 60}
+
+
+def test_bar_aggregator_includes_trades_at_close_time() -> None:
+    aggregator = BarAggregator(60)
+    trades = [(0.5, 10, 1), (30, 12, 1), (60, 11, 1), (60.5, 9, 2), (59, 20, 1)]
+    ticks = [aggregator.add(*trade) for trade in trades]
+
+    # ちょうど60秒の約定はCloseTimeが60の足に入り, 60.5秒の約定で確定する
+    assert ticks[:3] == [None, None, None]
+    tick = ticks[3]
+    assert tick is not None
+    assert tick.Index == pd.Timestamp(60, unit="s")
+    assert (tick.open, tick.high, tick.low, tick.close, tick.volume) == (
+        10,
+        12,
+        10,
+        11,
+        3,
+    )
+    # 確定済みの足の約定は捨てる
+    assert ticks[4] is None
+    assert aggregator.num_late == 1
+    last = aggregator.flush()
+    assert last is not None
+    assert last.Index == pd.Timestamp(120, unit="s")
+
+
+def test_bar_aggregator_matches_resampler() -> None:
+    # 1分足の終値をCloseTimeちょうどの約定とみなして15分足にする
+    df = read_ohlcv(INPUT_DIR / "btf_periods60.csv", compact=False)
+    times = df.index.values.astype("datetime64[s]").astype(np.int64)
+    aggregator = BarAggregator(900)
+    ticks = [
+        aggregator.add(t, price, size)
+        for t, price, size in zip(times, df["close"], df["volume"])
+    ]
+    ticks.append(aggregator.flush())
+    actual = pd.DataFrame([tick for tick in ticks if tick is not None])
+
+    expected = df.groupby(bucket_close_time(times, 900)).agg(
+        close=("close", "last"), volume=("volume", "sum")
+    )
+    np.testing.assert_array_equal(
+        actual["Index"].to_numpy().astype("datetime64[s]").astype(np.int64),
+        expected.index.to_numpy(),
+    )
+    np.testing.assert_array_equal(actual["close"], expected["close"])
+    np.testing.assert_allclose(actual["volume"], expected["volume"])
+
+
+async def run_replay(trader: LivePaperTrader, df: pd.DataFrame) -> int:
+    async with ReplayServer(df) as server:
+        return await trader.run(StreamBarFeed(server.host, server.port))
+
+
+@pytest.mark.parametrize(
+    "make_strategy",
+    [
+        lambda df: GoldenCrossStrategy(df, length_short=5, length_long=20),
+        FridayBuyStrategy,
+    ],
+    ids=["golden_cross", "friday_buy"],
+)
+def test_live_paper_trader_matches_backtest(
+    make_strategy: Callable[[pd.DataFrame], AbstractStrategy],
+) -> None:
+    df = read_ohlcv(INPUT_DIR / "btf_periods60.csv")
+
+    trader = LivePaperTrader(make_strategy(df), CONFIG)
+    num_bars = asyncio.run(run_replay(trader, df))
+    tester = BackTester(df, CONFIG)
+    Runner(tester, make_strategy(df)).run()
+
+    assert num_bars == len(df)
+    trades = backtester_trades(trader.tester)
+    assert any(trade[4] == "executed" for trade in trades)
+    assert trades == backtester_trades(tester)
+    pd.testing.assert_frame_equal(trader.tester.snapshots, tester.snapshots)
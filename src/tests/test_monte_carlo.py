@@ -0,0 +1,61 @@
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from library import simulator
+from library.analytics import drawdown
+from library.loader import read_ohlcv
+from library.monte_carlo import path_generators, run_random_policy
+from library.simulator import INITIAL_CASH, BackTester, myRunner
+from tests.conftest import INPUT_DIR
+
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 60}
+
+
+def test_random_policy_matches_my_runner(monkeypatch: pytest.MonkeyPatch) -> None:
+    df = read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+    n_paths = 3
+    result = run_random_policy(df, CONFIG, n_paths, seed=42, keep_paths=True)
+    assert result.valuation is not None
+    # myRunnerは数量0の注文で例外になるので, そのような注文のないパスで比べる
+    np.testing.assert_array_equal(result.num_rejected, 0)
+
+    for k, generator in enumerate(path_generators(42, n_paths)):
+        # myRunnerにもパスkと同じ乱数列を使わせる
+        draws: Iterator[float] = iter(generator.random(len(df)))
+        monkeypatch.setattr(simulator.random, "random", lambda: next(draws))
+        tester = BackTester(df, CONFIG)
+        myRunner(tester).run()
+
+        valuation = tester.snapshots["valuation"].to_numpy()
+        registry = tester.order_registry
+        np.testing.assert_array_equal(result.valuation[k], valuation)
+        assert result.max_drawdown[k] == drawdown(valuation).max()
+        assert (
+            result.num_executed[k],
+            result.num_expired[k],
+            result.num_invalid[k],
+        ) == (
+            registry.count("executed"),
+            registry.count("expired"),
+            registry.count("invalid"),
+        )
+
+
+def test_random_policy_masks_non_positive_size() -> None:
+    # 最初の買いは期限切れになり, ポジションがないので次の売りは数量0になる
+    index = pd.DatetimeIndex(
+        ["2023-01-01 00:00", "2023-01-01 02:00", "2023-01-01 02:15"],
+        name="timestamp",
+    )
+    df = pd.DataFrame({"close": [100.0, 100.0, 100.0]}, index=index)
+    result = run_random_policy(df, CONFIG, 4)
+
+    np.testing.assert_array_equal(result.num_executed, 0)
+    np.testing.assert_array_equal(result.num_expired, 1)
+    # BackTesterなら例外になって記録されない注文なので, 無効には数えない
+    np.testing.assert_array_equal(result.num_invalid, 0)
+    np.testing.assert_array_equal(result.num_rejected, 1)
+    np.testing.assert_array_equal(result.final_valuation, INITIAL_CASH)
@@ -0,0 +1,45 @@
+from typing import Callable
+
+import pandas as pd
+import pytest
+
+from library.array_simulator import ArrayBackTester
+from library.loader import read_ohlcv
+from library.runner import Runner
+from library.simulator import BackTester
+from library.strategy import AbstractStrategy, FridayBuyStrategy, GoldenCrossStrategy
+from tests.conftest import INPUT_DIR, array_trades, backtester_trades
+
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 600}
+
+
+@pytest.mark.parametrize(
+    "make_strategy",
+    [
+        lambda df: GoldenCrossStrategy(df, length_short=15, length_long=30),
+        FridayBuyStrategy,
+    ],
+    ids=["golden_cross", "friday_buy"],
+)
+# precompute=Falseなら, Runnerは毎バーget_signalを呼ぶ元の経路で動く
+@pytest.mark.parametrize("precompute", [True, False])
+def test_array_backtester_matches_runner(
+    make_strategy: Callable[[pd.DataFrame], AbstractStrategy], precompute: bool
+) -> None:
+    df = read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+
+    tester = BackTester(df, CONFIG)
+    Runner(tester, make_strategy(df), precompute=precompute).run()
+    signals = make_strategy(df).compute_signals(df)
+    assert signals is not None
+    array_tester = ArrayBackTester(df, CONFIG)
+    array_tester.run(signals)
+
+    trades = backtester_trades(tester)
+    assert any(trade[4] == "executed" for trade in trades)
+    assert trades == array_trades(array_tester)
+    assert tester.cash == array_tester.cash
+    assert tester.position == array_tester.position
+    pd.testing.assert_frame_equal(
+        tester.snapshots, array_tester.snapshots, check_index_type=False
+    )
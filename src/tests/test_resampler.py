@@ -0,0 +1,49 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from library import csv_tail
+from library.resampler import add_resampled_data, read_csv_after, resample
+from library.storage import drop_non_numeric, to_frame, to_records
+from tests.conftest import INPUT_DIR
+
+PERIODS = 900
+
+
+def read_clean(path: Path) -> np.ndarray:
+    df = drop_non_numeric(pd.read_csv(path, dtype=str))
+    return to_records(df.drop_duplicates("CloseTime", keep="last"))
+
+
+def test_add_resampled_data_skips_conflict_markers(tmp_path: Path) -> None:
+    # 同梱の1分足にはgitのコンフリクトマーカーの行が含まれている
+    source_path = tmp_path / "btf_periods60.csv"
+    shutil.copy(INPUT_DIR / "btf_periods60.csv", source_path)
+    source = read_clean(source_path)
+    expected = resample(source, PERIODS)
+    expected = expected[expected["CloseTime"] <= source["CloseTime"][-1]]
+
+    # 途中までの足を, 末尾に改行のないcsvとして用意する
+    save_path = tmp_path / f"btf_periods{PERIODS}.csv"
+    n = len(expected) - 50
+    save_path.write_text(csv_tail.format_rows(to_frame(expected[:n]).values).rstrip())
+
+    add_resampled_data(PERIODS, source_path, save_path)
+
+    actual = drop_non_numeric(pd.read_csv(save_path))
+    pd.testing.assert_frame_equal(actual, to_frame(expected), check_dtype=False)
+
+
+def test_read_csv_after_reads_only_new_rows(tmp_path: Path) -> None:
+    source_path = tmp_path / "btf_periods60.csv"
+    shutil.copy(INPUT_DIR / "btf_periods60.csv", source_path)
+    source = read_clean(source_path)
+    close_time = int(source["CloseTime"][-100])
+
+    offset = csv_tail.offset_after(source_path, close_time)
+    assert offset > source_path.stat().st_size - 100 * 100
+    records = read_csv_after(source_path, close_time)
+    np.testing.assert_array_equal(records, source[source["CloseTime"] > close_time])
+    assert len(read_csv_after(source_path, int(source["CloseTime"][-1]))) == 0
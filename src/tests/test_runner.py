@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from library.array_simulator import ArrayBackTester
+from library.loader import read_ohlcv
+from library.runner import Runner
+from library.simulator import BackTester, LimitOrder, SignalArrays
+from library.strategy import GoldenCrossStrategy
+from tests.conftest import INPUT_DIR, array_trades, backtester_trades
+
+CONFIG = {"slippage": 0.001, "minutes_to_expire": 600}
+
+
+class LimitGoldenCross(GoldenCrossStrategy):
+    """
+    偶数本目のシグナルだけ終値から0.5%不利な価格の指値にし, 残りは成行にする
+    """
+
+    def compute_signals(self, df: pd.DataFrame) -> SignalArrays:
+        signals = super().compute_signals(df)
+        limit_price = np.round(df["close"].to_numpy() * 1.005)
+        limit_price[1::2] = np.nan
+        return signals._replace(limit_price=limit_price)
+
+
+def test_runner_places_limit_orders_like_array_backtester() -> None:
+    df = read_ohlcv(INPUT_DIR / "btf_periods900.csv", compact=False)
+    strategy = LimitGoldenCross(df, length_short=15, length_long=30)
+    signals = strategy.compute_signals(df)
+    assert signals.limit_price is not None
+    assert np.isnan(signals.limit_price).any()
+
+    tester = BackTester(df, CONFIG)
+    Runner(tester, strategy).run()
+    array_tester = ArrayBackTester(df, CONFIG)
+    array_tester.run(signals)
+
+    orders = tester.order_registry.archived
+    assert any(isinstance(order, LimitOrder) for order in orders)
+    assert any(not isinstance(order, LimitOrder) for order in orders)
+    assert backtester_trades(tester) == array_trades(array_tester)
+    assert tester.cash == array_tester.cash
+    assert tester.position == array_tester.position
@@ -0,0 +1,72 @@
+import pandas as pd
+
+from library.live import OHLCV_COLUMNS
+from library.simulator import BackTester, LimitOrder, MarketOrder, Order
+
+CONFIG = {"slippage": 0.0, "minutes_to_expire": 3}
+
+
+def make_ohlcv(bars: list[tuple[float, float, float, float]]) -> pd.DataFrame:
+    index = pd.date_range(
+        "2023-01-01", periods=len(bars), freq="1min", name="timestamp"
+    )
+    return pd.DataFrame(
+        [bar + (1.0,) for bar in bars], index=index, columns=OHLCV_COLUMNS
+    )
+
+
+def test_handle_orders_processes_candidates_in_id_order() -> None:
+    df = make_ohlcv(
+        [
+            (100, 110, 90, 100),
+            (100, 100, 100, 100),  # 値動きのない足
+            (100, 110, 90, 105),
+            (105, 110, 90, 105),
+            (105, 110, 90, 105),
+        ]
+    )
+    tester = BackTester(df, CONFIG)
+    now_time = next(tester)
+    resting = LimitOrder(now_time, "BUY", 1, 100)
+    market = MarketOrder(now_time, "BUY", 1)
+    limit = LimitOrder(now_time, "BUY", 1, 95)
+    too_large = LimitOrder(now_time, "BUY", 10**6, 100)
+    orders: list[Order] = [resting, market, limit, too_large]
+    for order in orders:
+        tester.add_order(order)
+
+    # 値動きのない足では, ちょうどその価格の指値は約定候補にならず残るが,
+    # 有効性のチェックは毎バー行うので, 買えない注文はこの足で無効になる
+    next(tester)
+    assert tester.archived_orders == [market, limit, too_large]
+    assert tester.active_orders == [resting]
+
+    # 約定候補になった足で約定する
+    next(tester)
+    assert tester.archived_orders == [market, limit, too_large, resting]
+    assert [order.result.completion_status for order in tester.archived_orders] == [
+        "executed",
+        "executed",
+        "invalid",
+        "executed",
+    ]
+    assert tester.cash == 1000000 - 100 - 95 - 100
+    assert tester.position == 3
+
+
+def test_handle_orders_expires_in_id_order() -> None:
+    df = make_ohlcv([(100, 100, 100, 100)] * 5)
+    tester = BackTester(df, CONFIG)
+    now_time = next(tester)
+    # 後から出した注文の方が発注時刻が早く, 期限切れになる時刻も早い
+    first = LimitOrder(now_time, "BUY", 1, 100)
+    second = LimitOrder(now_time - pd.Timedelta(seconds=30), "BUY", 1, 100)
+    tester.add_order(first)
+    tester.add_order(second)
+
+    for _ in range(2):
+        next(tester)
+    assert tester.archived_orders == []
+    next(tester)
+    assert tester.archived_orders == [first, second]
+    assert all(order.result.completion_status == "expired" for order in [first, second])
@@ -0,0 +1,135 @@
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from library import csv_tail
+from library.bucket import LocalBucket
+from library.storage import to_frame, to_records
+from library.updater import DeltaUpdater
+from tests.conftest import FakeCryptowatch
+
+PERIODS = [60, 300]
+START = 1_700_000_100  # 60と300の倍数
+N_BASE = 100  # 最初から本体にある足の数
+COMPACT_EVERY = 3
+CONFLICT_MARKERS = "<<<<<<< Updated upstream\n=======\n>>>>>>> Stashed changes\n"
+
+
+def expected_frame(bars: list[list], last_close_time: int) -> pd.DataFrame:
+    return to_frame(to_records([bar for bar in bars if bar[0] <= last_close_time]))
+
+
+@pytest.fixture
+def bucket(tmp_path: Path) -> LocalBucket:
+    return LocalBucket(tmp_path / "bucket")
+
+
+@pytest.fixture
+def bars(fake_api: FakeCryptowatch, bucket: LocalBucket) -> dict[int, list[list]]:
+    """
+    APIに2000本ずつ用意し, 先頭のN_BASE本を本体のcsvとしてバケットに置く.
+    本体には同梱のcsvと同じくコンフリクトマーカーの行を混ぜておく.
+    """
+    bars = {periods: fake_api.serve(periods, START, 2000) for periods in PERIODS}
+    for periods in PERIODS:
+        half = N_BASE // 2
+        text = csv_tail.format_rows(bars[periods][:half])
+        text += CONFLICT_MARKERS + csv_tail.format_rows(
+            bars[periods][half:N_BASE], header=False
+        )
+        bucket.upload(f"data/btf_periods{periods}.csv", text.encode())
+    return bars
+
+
+def make_updater(bucket: LocalBucket, fake_api: FakeCryptowatch) -> DeltaUpdater:
+    return DeltaUpdater(bucket, compact_every=COMPACT_EVERY, base_url=fake_api.url)
+
+
+def at(close_time: int) -> dt.datetime:
+    return dt.datetime.fromtimestamp(close_time)
+
+
+def test_run_uploads_segments_and_compacts(
+    bucket: LocalBucket, fake_api: FakeCryptowatch, bars: dict[int, list[list]]
+) -> None:
+    updater = make_updater(bucket, fake_api)
+    now = START + 300 * N_BASE
+    for i in range(1, 2 * COMPACT_EVERY + 1):
+        now += 600
+        manifest = updater.run(PERIODS, now=at(now))
+        for periods in PERIODS:
+            entry = manifest[str(periods)]
+            assert entry["last_close_time"] == now - now % periods
+            assert len(entry["segments"]) == i % COMPACT_EVERY
+            assert bucket.list(f"data/segments/btf_periods{periods}/") == sorted(
+                entry["segments"]
+            )
+            df = updater.read_frame(periods)
+            pd.testing.assert_frame_equal(
+                df, expected_frame(bars[periods], entry["last_close_time"])
+            )
+
+    # compaction後の本体は数値の行だけで, CloseTimeの昇順
+    for periods in PERIODS:
+        data = bucket.download(updater.object_name(periods))
+        assert data is not None
+        assert b"<<<<<<<" not in data
+        assert data.decode().splitlines()[0] == ",".join(csv_tail.COLUMNS)
+
+
+def test_run_skips_api_until_next_bar_closes(
+    bucket: LocalBucket, fake_api: FakeCryptowatch, bars: dict[int, list[list]]
+) -> None:
+    updater = make_updater(bucket, fake_api)
+    now = START + 300 * N_BASE + 30
+    manifest = updater.run(PERIODS, now=at(now))
+    num_requests = len(fake_api.requests)
+    assert updater.run(PERIODS, now=at(now + 20)) == manifest
+    assert len(fake_api.requests) == num_requests
+
+
+def test_read_frame_after_interrupted_compaction(
+    bucket: LocalBucket,
+    fake_api: FakeCryptowatch,
+    bars: dict[int, list[list]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    updater = make_updater(bucket, fake_api)
+    now = START + 300 * N_BASE
+    for _ in range(COMPACT_EVERY - 1):
+        now += 600
+        updater.run(PERIODS, now=at(now))
+    before = updater.load_manifest()
+
+    # 本体をアップロードした後, manifestを保存する前に落ちる
+    def fail(manifest: dict) -> None:
+        raise ConnectionError("manifest upload failed")
+
+    monkeypatch.setattr(updater, "save_manifest", fail)
+    with pytest.raises(ConnectionError):
+        updater.run(PERIODS, now=at(now + 600))
+    monkeypatch.undo()
+    assert updater.load_manifest() == before
+
+    # 本体にも差分にも同じ足があるが, 重複せずに読める
+    for periods in PERIODS:
+        entry = before[str(periods)]
+        for name in entry["segments"]:
+            assert bucket.download(name) is not None
+        pd.testing.assert_frame_equal(
+            updater.read_frame(periods),
+            expected_frame(bars[periods], now + 600 - (now + 600) % periods),
+        )
+
+    # 再実行すれば続きから更新される
+    now += 1200
+    manifest = updater.run(PERIODS, now=at(now))
+    for periods in PERIODS:
+        entry = manifest[str(periods)]
+        assert entry["segments"] == []
+        pd.testing.assert_frame_equal(
+            updater.read_frame(periods),
+            expected_frame(bars[periods], now - now % periods),
+        )